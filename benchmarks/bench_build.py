@@ -0,0 +1,45 @@
+"""Compare PassBuilder.build() in memory against the temporal dir build.
+
+    python benchmarks/bench_build.py [--repeat 50]
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from utils import bench, setup_django
+
+ASSET_COUNTS = (5, 20, 100)
+ASSET_SIZE = 8 * 1024
+
+
+def make_template(directory, assets):
+    with open(os.path.join(directory, 'pass.json'), 'w', encoding='utf8') as ffile:
+        json.dump({"formatVersion": 1, "description": "Benchmark"}, ffile)
+    for i in range(assets - 1):
+        subdir = os.path.join(directory, f'{i % 4}.lproj') if i % 3 == 0 else directory
+        os.makedirs(subdir, exist_ok=True)
+        with open(os.path.join(subdir, f'asset{i}.png'), 'wb') as ffile:
+            ffile.write(os.urandom(ASSET_SIZE // 2) + bytes(ASSET_SIZE // 2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django_walletpass.services import PassBuilder  # pylint: disable=import-outside-toplevel
+
+    print(f"{'assets':>6} {'tmp dir ms':>11} {'in memory ms':>13} {'speedup':>8}")
+    for assets in ASSET_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            make_template(directory, assets)
+            builder = PassBuilder(directory=directory)
+            tmp_dir = bench(lambda: builder.build(in_memory=False), args.repeat)  # pylint: disable=cell-var-from-loop
+            in_memory = bench(lambda: builder.build(in_memory=True), args.repeat)  # pylint: disable=cell-var-from-loop
+        print(f"{assets:>6} {tmp_dir * 1000:>11.2f} {in_memory * 1000:>13.2f} {tmp_dir / in_memory:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
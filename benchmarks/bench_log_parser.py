@@ -0,0 +1,79 @@
+"""Device log lines parsed per second by the legacy Log patterns (every pattern
+matched on every message) against log_parser.parse_message.
+
+    python benchmarks/bench_log_parser.py [--lines 5000] [--repeat 5]
+"""
+import argparse
+import random
+import re
+
+from utils import bench, setup_django
+
+PASS_TYPE = 'pass.com.develatio.devpubs.example'
+URL = 'https://example.com/passes/'
+TEMPLATES = (
+    "[{ts}] Register task (for device {device}, pass type {pass_type}, serial number {serial}; "
+    "with web service url {url}) encountered error: Unexpected response code 401",
+    "[{ts}] Unregister task (for device {device}, pass type {pass_type}, serial number {serial}; "
+    "with web service url {url}) encountered error: Server response was malformed (Missing response data)",
+    "[{ts}] Get pass task (pass type {pass_type}, serial number {serial}, if-modified-since (null); "
+    "with web service url {url}) encountered error: Unexpected response code 404",
+    "[{ts}] Get pass task (pass type {pass_type}, serial number {serial}, if-modified-since "
+    "(Mon, 08 Jul 2024 08:03:13 GMT); with web service url {url}) encountered warning: "
+    "Server returned an invalid pass. {detail}",
+    "[{ts}] Web service error for {pass_type} ({url}): Response to 'What changed?' request included "
+    "1 serial numbers but the lastUpdated tag (2024-07-08T08:03:13.588412+00:00) remained the same.",
+    "[{ts}] Web service error for {pass_type} ({url}): Server returned 500 {detail}",
+    "Passbook fetch failed {detail}",
+)
+
+
+def make_corpus(lines, seed=0):
+    rand = random.Random(seed)
+    corpus = []
+    for _ in range(lines):
+        corpus.append(rand.choice(TEMPLATES).format(
+            ts=f"2024-07-{rand.randint(1, 28):02d} {rand.randint(1, 12):02d}:{rand.randint(0, 59):02d}:"
+               f"{rand.randint(0, 59):02d} {rand.choice(('AM', 'PM'))} +0200",
+            device=f"{rand.getrandbits(128):032x}",
+            pass_type=PASS_TYPE,
+            serial=f"{rand.getrandbits(64):016x}",
+            url=URL,
+            detail=' '.join(
+                rand.choice(('lorem', 'ipsum', 'dolor', 'sit', 'amet')) for _ in range(rand.randint(5, 80))
+            ),
+        ))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    # pylint: disable=import-outside-toplevel
+    from dateutil.parser import parse as datetime_parse
+    from django_walletpass import log_parser
+    from django_walletpass.models import log
+
+    def legacy_parse(message):
+        # what Log.parse_log did before log_parser, without saving
+        match_register = re.match(log.PATTERN_REGISTER, message)
+        match_get = re.match(log.PATTERN_GET, message)
+        match_web_service_error = re.match(log.PATTERN_WEB_SERVICE_ERROR, message)
+        re.match(log.PATTERN_GET_WARNING, message)
+        match = match_register or match_get or match_web_service_error
+        if match:
+            datetime_parse(match.group(1))
+
+    corpus = make_corpus(args.lines)
+    before = bench(lambda: [legacy_parse(message) for message in corpus], args.repeat)
+    after = bench(lambda: [log_parser.parse_message(message) for message in corpus], args.repeat)
+    print(f"legacy patterns: {args.lines / before:>10.0f} lines/s")
+    print(f"log_parser:      {args.lines / after:>10.0f} lines/s ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Pushes per second against a local HTTP/2 APNs stand-in, reusing the pooled
+APNs client against creating one client (TLS + HTTP/2 handshake, JWT) per push.
+
+    python benchmarks/bench_push.py [--pushes 500]
+"""
+import argparse
+import asyncio
+import ssl
+import tempfile
+import time
+
+from utils import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pushes', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    # pylint: disable=import-outside-toplevel
+    from aioapns import APNs
+    from django_walletpass import apns_server
+    from django_walletpass.services.push_backend import PushBackend, apns_clients
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert_path, key_path = apns_server.write_self_signed_cert(directory)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(apns_server.start_server(cert_path, key_path))
+        port = server.sockets[0].getsockname()[1]
+
+        class LocalPushBackend(PushBackend):
+            def create_client(self, topic):
+                client = APNs(
+                    key=key_path,
+                    key_id='KEYID',
+                    team_id='TEAMID',
+                    topic=topic,
+                    ssl_context=ssl.create_default_context(cafile=cert_path),
+                )
+                client.pool.protocol_class = apns_server.client_protocol_class(port)
+                return client
+
+        backend = LocalPushBackend()
+
+        def run(reuse):
+            start = time.perf_counter()
+            for i in range(args.pushes):
+                if not reuse:
+                    apns_clients.close()
+                result = backend.push_notification_with_token(f'token{i}')
+                assert result.is_successful
+            return args.pushes / (time.perf_counter() - start)
+
+        run(reuse=True)  # warm up
+        without_reuse = run(reuse=False)
+        with_reuse = run(reuse=True)
+        apns_clients.close()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+
+    print(f"new client per push: {without_reuse:>9.1f} pushes/s")
+    print(f"pooled client:       {with_reuse:>9.1f} pushes/s ({with_reuse / without_reuse:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""Signs per second parsing certificates and key on every call (pkcs7_sign)
+against a reused crypto.Signer.
+
+    python benchmarks/bench_sign.py [--repeat 200]
+"""
+import argparse
+
+from utils import bench, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    # pylint: disable=import-outside-toplevel
+    from django_walletpass import crypto
+    from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+    data = b'{"pass.json": "0123456789abcdef0123456789abcdef01234567"}'
+
+    def pkcs7_sign():
+        crypto.pkcs7_sign(
+            certcontent=WALLETPASS_CONF['CERT_CONTENT'],
+            keycontent=WALLETPASS_CONF['KEY_CONTENT'],
+            wwdr_certificate=WALLETPASS_CONF['WWDRCA_PEM_CONTENT'],
+            data=data,
+            key_password=WALLETPASS_CONF['KEY_PASSWORD'],
+        )
+
+    signer = crypto.get_signer()
+    before = bench(pkcs7_sign, args.repeat)
+    after = bench(lambda: signer.sign(data), args.repeat)
+    print(f"pkcs7_sign:  {1 / before:>9.1f} signs/s")
+    print(f"Signer.sign: {1 / after:>9.1f} signs/s ({before / after:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
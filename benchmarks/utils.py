@@ -0,0 +1,24 @@
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLE_DIR = os.path.join(BASE_DIR, 'example')
+
+
+def setup_django():
+    """Configure django using the example project settings"""
+    sys.path.insert(0, BASE_DIR)
+    sys.path.insert(0, EXAMPLE_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+    import django  # pylint: disable=import-outside-toplevel
+    django.setup()
+
+
+def bench(func, repeat):
+    """Call func repeat times and return the mean seconds per call"""
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
@@ -3,7 +3,7 @@ from django.template import Context, Template
 from django.urls import reverse
 from django.utils.html import format_html
 
-from django_walletpass.models import Log, Pass, Registration
+from django_walletpass.models import Log, LogRollup, Pass, PushOutbox, Registration
 
 
 @admin.register(Log)
@@ -30,6 +30,11 @@ class LogAdmin(admin.ModelAdmin):
     readonly_fields = ("created_at", "pass_")
     raw_id_fields = ("pazz",)
     list_select_related = ("pazz",)
+    # Skip the second, unfiltered COUNT(*) run to show the total next to
+    # filtered results. Pagination still counts the filtered rows and each
+    # list_filter reads the distinct values of its field; use LogRollupAdmin
+    # for counts over a large table.
+    show_full_result_count = False
 
     def pass_(self, obj: Log):
         if obj.pazz_id:
@@ -49,6 +54,13 @@ class LogAdmin(admin.ModelAdmin):
     pass_.short_description = "Pass"
 
 
+@admin.register(LogRollup)
+class LogRollupAdmin(admin.ModelAdmin):
+    list_display = ("day", "status", "task_type", "pass_type_identifier", "count")
+    list_filter = ("status", "task_type", "pass_type_identifier")
+    date_hierarchy = "day"
+
+
 @admin.register(Pass)
 class PassAdmin(admin.ModelAdmin):
     list_display = (
@@ -107,3 +119,11 @@ class RegistrationAdmin(admin.ModelAdmin):
         return ""
 
     pass_.short_description = "Pass"
+
+
+@admin.register(PushOutbox)
+class PushOutboxAdmin(admin.ModelAdmin):
+    list_display = ("pazz", "enqueued_at", "next_attempt_at", "attempts", "coalesced", "last_error")
+    search_fields = ("pazz__serial_number", "last_error")
+    raw_id_fields = ("pazz",)
+    list_select_related = ("pazz",)
@@ -0,0 +1,251 @@
+"""Local APNs stand-in for benchmarks and tests: HTTP/2 over TLS with a
+self-signed cert. Statuses and latency of the responses are set with a
+ResponsePlan.
+"""
+import asyncio
+import datetime
+import ipaddress
+import json
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from aioapns.connection import APNsProductionClientProtocol
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import DataReceived, RequestReceived, StreamEnded
+
+HOST = '127.0.0.1'
+
+# reason sent by APNs with every error status
+REASONS = {
+    '400': 'BadDeviceToken',
+    '403': 'InvalidProviderToken',
+    '410': 'Unregistered',
+    '413': 'PayloadTooLarge',
+    '429': 'TooManyRequests',
+    '500': 'InternalServerError',
+    '503': 'ServiceUnavailable',
+}
+
+
+def write_pem(path, content):
+    with open(path, 'wb') as ffile:
+        ffile.write(content)
+    return path
+
+
+def write_private_key(path):
+    """Write a new P-256 private key (valid for APNs JWT and TLS)"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    write_pem(path, key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ))
+    return key
+
+
+def write_self_signed_cert(directory):
+    """Write cert.pem and key.pem for localhost / 127.0.0.1 into directory"""
+    key = write_private_key(os.path.join(directory, 'key.pem'))
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName('localhost'),
+            x509.IPAddress(ipaddress.ip_address(HOST)),
+        ]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = write_pem(os.path.join(directory, 'cert.pem'), cert.public_bytes(serialization.Encoding.PEM))
+    return cert_path, os.path.join(directory, 'key.pem')
+
+
+def parse_statuses(value):
+    """Parse a "status=weight,..." string, e.g. "200=0.98,410=0.01,429=0.01"
+
+    Returns:
+        dict: status -> weight
+    """
+    statuses = {}
+    for item in value.split(','):
+        status, _sep, weight = item.strip().partition('=')
+        statuses[status] = float(weight or 1)
+    return statuses
+
+
+class ResponsePlan:
+    """How the server answers. Every response gets a status chosen at random
+    with the weights of statuses and is sent after latency seconds, or
+    spike_latency seconds with probability spike_rate.
+
+    Args:
+        statuses (dict, optional): status -> weight. Defaults to {'200': 1}.
+        latency (float, optional): seconds. Defaults to 0.
+        spike_rate (float, optional): probability of a latency spike. Defaults to 0.
+        spike_latency (float, optional): seconds. Defaults to 0.
+        seed (int, optional): random seed. Defaults to None.
+    """
+
+    def __init__(self, statuses=None, latency=0, spike_rate=0, spike_latency=0, seed=None):
+        statuses = statuses or {'200': 1}
+        self.statuses = list(statuses)
+        self.weights = list(statuses.values())
+        self.latency = latency
+        self.spike_rate = spike_rate
+        self.spike_latency = spike_latency
+        self.random = random.Random(seed)
+        # status -> responses sent
+        self.counts = Counter()
+
+    def choose(self):
+        """Returns:
+            tuple: (status, seconds to wait before answering)
+        """
+        status = self.random.choices(self.statuses, self.weights)[0]
+        self.counts[status] += 1
+        if self.spike_rate and self.random.random() < self.spike_rate:
+            return status, self.spike_latency
+        return status, self.latency
+
+
+class APNsServerProtocol(asyncio.Protocol):
+    def __init__(self, plan, max_concurrent_streams=1000):
+        self.transport = None
+        self.plan = plan
+        self.conn = H2Connection(H2Configuration(client_side=False, header_encoding='utf-8'))
+        self.conn.local_settings.max_concurrent_streams = max_concurrent_streams
+        self.streams = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, RequestReceived):
+                self.streams[event.stream_id] = dict(event.headers)
+            elif isinstance(event, DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, StreamEnded):
+                headers = self.streams.pop(event.stream_id)
+                status, delay = self.plan.choose()
+                if delay:
+                    asyncio.get_running_loop().call_later(delay, self.respond, event.stream_id, headers, status)
+                else:
+                    self.respond(event.stream_id, headers, status, flush=False)
+        self.transport.write(self.conn.data_to_send())
+
+    def respond(self, stream_id, headers, status, flush=True):
+        if self.transport.is_closing():
+            return
+        response_headers = [(':status', status), ('apns-id', headers.get('apns-id', ''))]
+        if status == '200':
+            self.conn.send_headers(stream_id, response_headers, end_stream=True)
+        else:
+            body = {'reason': REASONS.get(status, 'InternalServerError')}
+            if status == '410':
+                body['timestamp'] = int(time.time() * 1000)
+            self.conn.send_headers(stream_id, response_headers)
+            self.conn.send_data(stream_id, json.dumps(body).encode(), end_stream=True)
+        if flush:
+            self.transport.write(self.conn.data_to_send())
+
+
+async def start_server(cert_path, key_path, plan=None):
+    """Start the server on a random port of HOST
+
+    Args:
+        cert_path (str): TLS certificate, see write_self_signed_cert()
+        key_path (str): TLS private key
+        plan (ResponsePlan, optional): defaults to 200 without latency
+
+    Returns:
+        asyncio.Server: running server
+    """
+    plan = plan or ResponsePlan()
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert_path, key_path)
+    context.set_alpn_protocols(['h2'])
+    return await asyncio.get_running_loop().create_server(
+        lambda: APNsServerProtocol(plan), HOST, 0, ssl=context,
+    )
+
+
+class LocalAPNsServer:
+    """Run the server with its own event loop in a background thread, with a
+    new self-signed cert. key_path is also a valid APNs auth key (P-256).
+
+        with LocalAPNsServer(ResponsePlan({'200': 99, '410': 1})) as server:
+            client.pool.protocol_class = client_protocol_class(server.port)
+
+    Args:
+        plan (ResponsePlan, optional): defaults to 200 without latency
+    """
+
+    def __init__(self, plan=None):
+        self.plan = plan or ResponsePlan()
+        self.cert_path = None
+        self.key_path = None
+        self._directory = None
+        self._loop = None
+        self._thread = None
+        self._server = None
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        self._directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.cert_path, self.key_path = write_self_signed_cert(self._directory.name)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='walletpass-apns-server', daemon=True)
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(
+            start_server(self.cert_path, self.key_path, self.plan), self._loop,
+        ).result()
+        return self
+
+    def stop(self):
+        self._server.close()
+        try:
+            asyncio.run_coroutine_threadsafe(self._server.wait_closed(), self._loop).result(timeout=5)
+        except TimeoutError:
+            # Python 3.12+ also waits for the connections left open by clients
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._directory.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def client_protocol_class(port):
+    """aioapns protocol class connecting to the local server"""
+    return type('LocalAPNsProtocol', (APNsProductionClientProtocol, ), {
+        'APNS_SERVER': HOST,
+        'APNS_PORT': port,
+    })
@@ -0,0 +1,25 @@
+from django.urls import re_path
+from . import asyncviews
+
+urlpatterns = [
+    re_path(
+        r'^v1/devices/(?P<device_library_id>.+)/registrations/(?P<pass_type_id>.+)/(?P<serial_number>.+)$',
+        asyncviews.register_pass,
+        name='walletpass_register_pass',
+    ),
+    re_path(
+        r'^v1/devices/(?P<device_library_id>.+)/registrations/(?P<pass_type_id>.+)$',
+        asyncviews.registrations,
+        name='walletpass_registrations',
+    ),
+    re_path(
+        r'^v1/passes/(?P<pass_type_id>.+)/(?P<serial_number>.+)$',
+        asyncviews.latest_version,
+        name='walletpass_latest_version',
+    ),
+    re_path(
+        r'^v1/log$',
+        asyncviews.log,
+        name='walletpass_log',
+    ),
+]
@@ -0,0 +1,139 @@
+"""Async versions of the Wallet web service endpoints (classviews), for ASGI
+deployments. Use them with django_walletpass.asyncurls. Requires Django 4.2+.
+"""
+import json
+from calendar import timegm
+
+import django
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from django_walletpass import pass_cache
+from django_walletpass.classviews import (
+    PKPASS_CONTENT_DISPOSITION,
+    PKPASS_CONTENT_TYPE,
+    get_sendfile_response,
+    get_updated_serial_numbers,
+    is_authorized,
+)
+from django_walletpass.models import Log, Pass, Registration
+from django_walletpass.services.log_writer import log_writer
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+from django_walletpass.signals import PASS_REGISTERED, PASS_UNREGISTERED, asend
+
+if django.VERSION < (4, 2):
+    raise ImportError("django_walletpass.asyncviews and asyncurls require Django 4.2+")
+
+CHUNK_SIZE = 64 * 1024
+
+
+def csrf_exempt(view):
+    # django.views.decorators.csrf.csrf_exempt keeps coroutines async on Django 5.0+ only
+    view.csrf_exempt = True
+    return view
+
+
+async def iter_file(field_file, chunk_size=CHUNK_SIZE):
+    """Read a stored file in chunks without blocking the event loop"""
+    await sync_to_async(field_file.open)('rb')
+    try:
+        while True:
+            chunk = await sync_to_async(field_file.read)(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(field_file.close)()
+
+
+@csrf_exempt
+async def registrations(request, device_library_id, pass_type_id):
+    """
+    Gets the Serial Numbers for Passes Associated with a Device
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    passes = [
+        row async for row in Pass.objects.filter(
+            registrations__device_library_identifier=device_library_id,
+            pass_type_identifier=pass_type_id,
+        ).values_list('serial_number', 'updated_at')
+    ]
+    if not passes:
+        return JsonResponse({}, status=400)
+    response_data = get_updated_serial_numbers(passes, request.GET.get('passesUpdatedSince'))
+    if response_data:
+        return JsonResponse(response_data)
+    return JsonResponse({}, status=204)
+
+
+@csrf_exempt
+async def register_pass(request, device_library_id, pass_type_id, serial_number):
+    """
+    post: Registers a Device to Receive Push Notifications for a Pass
+    delete: Unregister a Device
+    """
+    if request.method not in ('POST', 'DELETE'):
+        return HttpResponseNotAllowed(['POST', 'DELETE'])
+    pass_ = await pass_cache.aget_pass(pass_type_id, serial_number)
+    if not is_authorized(request, pass_):
+        return JsonResponse({}, status=401)
+
+    if request.method == 'DELETE':
+        if await Registration.aunregister(device_library_id, pass_.pk):
+            await asend(PASS_UNREGISTERED, sender=await pass_cache.aget_instance(pass_))
+        return JsonResponse({}, status=200)
+
+    body = json.loads(request.body)
+    if not await Registration.aregister(device_library_id, pass_.pk, body['pushToken']):
+        return JsonResponse({}, status=200)
+    await asend(PASS_REGISTERED, sender=await pass_cache.aget_instance(pass_))
+    return JsonResponse({}, status=201)
+
+
+@csrf_exempt
+async def latest_version(request, pass_type_id, serial_number):
+    """
+    get: Gets the latest version of a Pass
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    pass_ = await pass_cache.aget_pass(pass_type_id, serial_number)
+    if not is_authorized(request, pass_):
+        return JsonResponse({}, status=401)
+
+    last_modified = timegm(pass_.updated_at.utctimetuple())
+    etag = quote_etag(pass_.digest) if pass_.digest else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        pass_ = await pass_cache.aget_instance(pass_)
+        if WALLETPASS_CONF['STORAGE_HTTP_REDIRECT']:
+            return JsonResponse({}, status=302, headers={'Location': pass_.data.url})
+        response = get_sendfile_response(pass_)
+        if response is None:
+            response = StreamingHttpResponse(iter_file(pass_.data), content_type=PKPASS_CONTENT_TYPE)
+            response['Content-Disposition'] = PKPASS_CONTENT_DISPOSITION
+
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
+    return response
+
+
+@csrf_exempt
+async def log(request):
+    """
+    Logs messages from devices
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    messages = json.loads(request.body).get('logs', [])
+    if WALLETPASS_CONF['LOG_BUFFER']:
+        logs = [Log.from_message(message) for message in messages]
+        # put() may block when the buffer is full
+        await sync_to_async(log_writer.put, thread_sensitive=False)(logs)
+    else:
+        await Log.acreate_from_messages(messages)
+    return JsonResponse({}, status=200)
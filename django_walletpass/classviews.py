@@ -1,17 +1,22 @@
 import json
 from calendar import timegm
+from urllib.parse import quote
 
 from dateutil.parser import parse, ParserError
-from django.db.models import Max
-from django.http import HttpResponse
-from django.middleware.http import ConditionalGetMiddleware
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils.http import http_date
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, quote_etag
 from rest_framework import status, viewsets
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
+from django_walletpass import pass_cache
 from django_walletpass.models import Log, Pass, Registration
+from django_walletpass.services.log_writer import log_writer
 from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
 from django_walletpass.signals import PASS_REGISTERED, PASS_UNREGISTERED
 
@@ -19,11 +24,65 @@ from django_walletpass.signals import PASS_REGISTERED, PASS_UNREGISTERED
 # there anymore
 FORMAT = "%Y-%m-%d %H:%M:%S"
 
+PKPASS_CONTENT_TYPE = 'application/vnd.apple.pkpass'
+PKPASS_CONTENT_DISPOSITION = 'attachment; filename=pass.pkpass'
+
 
 def get_pass(pass_type_id, serial_number):
     return get_object_or_404(Pass, pass_type_identifier=pass_type_id, serial_number=serial_number)
 
 
+def is_authorized(request, pass_):
+    """Check the ApplePass authorization header in constant time"""
+    return constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f"ApplePass {pass_.authentication_token}",
+    )
+
+
+def parse_updated_since(value):
+    """Parse the passesUpdatedSince tag: UTC isoformat with TZ and FORMAT
+    datetime strings are supported. Naive dates are read in the current
+    timezone, like a queryset filter does.
+
+    Returns:
+        datetime: None if value can't be parsed
+    """
+    try:
+        date = parse(value)
+    except (ParserError, OverflowError, TypeError):
+        return None
+    if settings.USE_TZ and timezone.is_naive(date):
+        return timezone.make_aware(date)
+    if not settings.USE_TZ and timezone.is_aware(date):
+        return timezone.make_naive(date)
+    return date
+
+
+def get_updated_serial_numbers(passes, passes_updated_since=None):
+    """Response data of the registrations list endpoint
+
+    Args:
+        passes (list): (serial_number, updated_at) of the device passes
+        passes_updated_since (str, optional): passesUpdatedSince tag
+
+    Returns:
+        dict: None if no pass was updated since passes_updated_since
+    """
+    if passes_updated_since is not None:
+        date = parse_updated_since(passes_updated_since)
+        if date is not None:
+            passes = [(serial_number, updated_at) for serial_number, updated_at in passes if updated_at > date]
+    if not passes:
+        return None
+    last_updated = max(updated_at for _serial_number, updated_at in passes)
+    # dict.fromkeys(): a device may be registered more than once
+    serial_numbers = list(dict.fromkeys(
+        serial_number for serial_number, updated_at in passes if updated_at == last_updated
+    ))
+    return {'lastUpdated': last_updated.isoformat(), 'serialNumbers': serial_numbers}
+
+
 class RegistrationsViewSet(viewsets.ViewSet):
     """
     Gets the Serial Numbers for Passes Associated with a Device
@@ -31,27 +90,16 @@ class RegistrationsViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny, )
 
     def list(self, request, device_library_id, pass_type_id):
-        passes = Pass.objects.filter(
+        # One query: the device has few passes, filter them here
+        passes = list(Pass.objects.filter(
             registrations__device_library_identifier=device_library_id,
             pass_type_identifier=pass_type_id,
-        )
-        if passes.count() == 0:
+        ).values_list('serial_number', 'updated_at'))
+        if not passes:
             return Response({}, status=status.HTTP_400_BAD_REQUEST)
 
-        if 'passesUpdatedSince' in request.GET:
-            try:
-                # must be able to read UTC isoformat with TZ and FORMAT datetime string
-                # as well
-                date = parse(request.GET['passesUpdatedSince'])
-                passes = passes.filter(updated_at__gt=date)
-            except (ParserError, OverflowError, TypeError):
-                date = date.replace(hour=0, minute=0)
-                passes = passes.filter(updated_at__gt=date)
-
-        if passes:
-            last_updated = passes.aggregate(Max('updated_at'))['updated_at__max']
-            serial_numbers = [p.serial_number for p in passes.filter(updated_at=last_updated).all()]
-            response_data = {'lastUpdated': last_updated.isoformat(), 'serialNumbers': serial_numbers}
+        response_data = get_updated_serial_numbers(passes, request.GET.get('passesUpdatedSince'))
+        if response_data:
             return Response(response_data)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
@@ -69,40 +117,61 @@ class RegisterPassViewSet(viewsets.ViewSet):
 
     def create(self, request, device_library_id, pass_type_id, serial_number):
 
-        pass_ = get_pass(pass_type_id, serial_number)
-        if request.META.get('HTTP_AUTHORIZATION') != f"ApplePass {pass_.authentication_token}":
+        pass_ = pass_cache.get_pass(pass_type_id, serial_number)
+        if not is_authorized(request, pass_):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
-        registration = Registration.objects.filter(
-            device_library_identifier=device_library_id,
-            pazz=pass_,
-        )
-        if registration:
-            return Response({}, status=status.HTTP_200_OK)
         body = json.loads(request.body)
-        new_registration = Registration(
-            device_library_identifier=device_library_id,
-            push_token=body['pushToken'],
-            pazz=pass_,
-        )
-        new_registration.save()
-        PASS_REGISTERED.send(sender=pass_)
+        if not Registration.register(device_library_id, pass_.pk, body['pushToken']):
+            return Response({}, status=status.HTTP_200_OK)
+        PASS_REGISTERED.send(sender=pass_cache.get_instance(pass_))
         return Response({}, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, device_library_id, pass_type_id, serial_number):
-        pass_ = get_pass(pass_type_id, serial_number)
-        if request.META.get('HTTP_AUTHORIZATION') != f"ApplePass {pass_.authentication_token}":
+        pass_ = pass_cache.get_pass(pass_type_id, serial_number)
+        if not is_authorized(request, pass_):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
-        registration = Registration.objects.filter(
-            device_library_identifier=device_library_id,
-            pazz=pass_,
-        )
-        if not registration:
-            return Response({}, status=status.HTTP_200_OK)
-        registration.delete()
-        PASS_UNREGISTERED.send(sender=pass_)
+        if Registration.unregister(device_library_id, pass_.pk):
+            PASS_UNREGISTERED.send(sender=pass_cache.get_instance(pass_))
         return Response({}, status=status.HTTP_200_OK)
 
 
+def get_sendfile_response(pass_):
+    """Response handing the transfer of the .pkpass of pass_ to the web server
+    (X-Accel-Redirect or X-Sendfile), see STORAGE_SENDFILE.
+
+    Returns:
+        HttpResponse: None if disabled or the storage has no local paths
+    """
+    sendfile = WALLETPASS_CONF['STORAGE_SENDFILE']
+    try:
+        path = pass_.data.path if sendfile else None
+    except NotImplementedError:
+        # not a local storage
+        path = None
+    if not path:
+        return None
+    response = HttpResponse(content_type=PKPASS_CONTENT_TYPE)
+    if sendfile == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = quote(WALLETPASS_CONF['STORAGE_SENDFILE_PREFIX'] + pass_.data.name)
+    elif sendfile == 'x-sendfile':
+        response['X-Sendfile'] = path
+    else:
+        return None
+    response['Content-Disposition'] = PKPASS_CONTENT_DISPOSITION
+    return response
+
+
+def get_pass_file_response(pass_):
+    """Response with the .pkpass of pass_, see get_sendfile_response().
+    Otherwise the file is streamed in chunks.
+    """
+    response = get_sendfile_response(pass_)
+    if response is None:
+        response = FileResponse(pass_.data.open('rb'), content_type=PKPASS_CONTENT_TYPE)
+        response['Content-Disposition'] = PKPASS_CONTENT_DISPOSITION
+    return response
+
+
 class LatestVersionViewSet(viewsets.ViewSet):
     """
     get: Gets the latest version of a Pass
@@ -110,23 +179,25 @@ class LatestVersionViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny, )
 
     def retrieve(self, request, pass_type_id, serial_number):
-        pass_ = get_pass(pass_type_id, serial_number)
+        pass_ = pass_cache.get_pass(pass_type_id, serial_number)
 
-        if request.META.get('HTTP_AUTHORIZATION') != f"ApplePass {pass_.authentication_token}":
+        if not is_authorized(request, pass_):
             return Response({}, status=status.HTTP_401_UNAUTHORIZED)
 
-        if WALLETPASS_CONF['STORAGE_HTTP_REDIRECT']:
-            return Response({}, status=status.HTTP_302_FOUND, headers={'Location': pass_.data.url})
-
-        response = HttpResponse(pass_.data.read(), content_type='application/vnd.apple.pkpass')
-        response['Content-Disposition'] = 'attachment; filename=pass.pkpass'
-
-        response['Last-Modified'] = http_date(timegm(pass_.updated_at.utctimetuple()))
-
-        def _get_response(_request):
-            return response
+        # Decide 304 from the model, storage is only read for a 200
+        last_modified = timegm(pass_.updated_at.utctimetuple())
+        etag = quote_etag(pass_.digest) if pass_.digest else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            pass_ = pass_cache.get_instance(pass_)
+            if WALLETPASS_CONF['STORAGE_HTTP_REDIRECT']:
+                return Response({}, status=status.HTTP_302_FOUND, headers={'Location': pass_.data.url})
+            response = get_pass_file_response(pass_)
 
-        return ConditionalGetMiddleware(get_response=_get_response)(request)
+        response['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response['ETag'] = etag
+        return response
 
 
 # TODO: use ModelViewSet
@@ -137,7 +208,9 @@ class LogViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny, )
 
     def create(self, request):
-        for message in request.data.get('logs', []):
-            log = Log(message=message)
-            Log.parse_log(log, message)
+        messages = request.data.get('logs', [])
+        if WALLETPASS_CONF['LOG_BUFFER']:
+            log_writer.put([Log.from_message(message) for message in messages])
+        else:
+            Log.create_from_messages(messages)
         return Response({}, status=status.HTTP_200_OK)
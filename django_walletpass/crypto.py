@@ -6,14 +6,48 @@ from cryptography import x509
 from cryptography.hazmat.bindings.openssl.binding import Binding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.serialization import pkcs7
+from django.test.signals import setting_changed
 from django.utils.crypto import salted_hmac
 
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
 copenssl = Binding.lib
 cffi = Binding.ffi
 
 # SMIME isn't supported by pyca/cryptography:
 # https://github.com/pyca/cryptography/issues/1621
 # adjusted with latest cryptography code from https://github.com/devartis/passbook/pull/60/files
+class Signer:
+    """Sign data with PKCS#7 keeping certificates and private key loaded.
+
+    Args:
+        certcontent (bytes): Content of pem file certificate
+        keycontent (bytes): Content of key file
+        wwdr_certificate (bytes): Content of Intermediate cert file
+        key_password (bytes, optional): key file passwd. Defaults to None.
+    """
+
+    def __init__(self, certcontent, keycontent, wwdr_certificate, key_password=None):
+        self.cert = x509.load_pem_x509_certificate(certcontent)
+        self.priv_key = serialization.load_pem_private_key(keycontent, password=key_password)
+        self.wwdr_cert = x509.load_pem_x509_certificate(wwdr_certificate)
+
+    def sign(self, data):
+        """Return the detached DER signature of data
+
+        Args:
+            data (bytes): Data to be signed
+        """
+        options = [pkcs7.PKCS7Options.DetachedSignature]
+        return (
+            pkcs7.PKCS7SignatureBuilder()
+            .set_data(data)
+            .add_signer(self.cert, self.priv_key, hashes.SHA256())
+            .add_certificate(self.wwdr_cert)
+            .sign(serialization.Encoding.DER, options)
+        )
+
+
 def pkcs7_sign(
     certcontent, keycontent, wwdr_certificate, data, key_password=None,
 ):
@@ -26,19 +60,35 @@ def pkcs7_sign(
         data (bytes): Data to be signed
         key_password (bytes, optional): key file passwd. Defaults to None.
     """
+    signer = Signer(certcontent, keycontent, wwdr_certificate, key_password=key_password)
+    return signer.sign(data)
+
+
+_signer = None
+
+
+def get_signer():
+    """Return the Signer built from WALLETPASS_CONF. It's built on first use
+    and rebuilt after the WALLETPASS setting changes.
+    """
+    global _signer  # pylint: disable=global-statement
+    if _signer is None:
+        _signer = Signer(
+            certcontent=WALLETPASS_CONF['CERT_CONTENT'],
+            keycontent=WALLETPASS_CONF['KEY_CONTENT'],
+            wwdr_certificate=WALLETPASS_CONF['WWDRCA_PEM_CONTENT'],
+            key_password=WALLETPASS_CONF['KEY_PASSWORD'],
+        )
+    return _signer
+
+
+def reset_signer(*args, **kwargs):  # pylint: disable=unused-argument
+    global _signer  # pylint: disable=global-statement
+    if kwargs['setting'] == 'WALLETPASS':
+        _signer = None
+
 
-    cert = x509.load_pem_x509_certificate(certcontent)
-    priv_key = serialization.load_pem_private_key(keycontent, password=key_password)
-    wwdr_cert = x509.load_pem_x509_certificate(wwdr_certificate)
-
-    options = [pkcs7.PKCS7Options.DetachedSignature]
-    return (
-        pkcs7.PKCS7SignatureBuilder()
-        .set_data(data)
-        .add_signer(cert, priv_key, hashes.SHA256())
-        .add_certificate(wwdr_cert)
-        .sign(serialization.Encoding.DER, options)
-    )
+setting_changed.connect(reset_signer)
 
 
 def gen_random_token():
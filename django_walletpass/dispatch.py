@@ -0,0 +1,39 @@
+"""Signals and the GONE token collector. Kept apart from signals.py, which
+connects the receivers and imports the models, so the models can use them.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.dispatch import Signal
+
+TOKEN_UNREGISTERED = Signal()
+PASS_REGISTERED = Signal()
+PASS_UNREGISTERED = Signal()
+
+# Set of GONE tokens collected by collect_gone_tokens()
+GONE_TOKENS = ContextVar('walletpass_gone_tokens', default=None)
+
+
+async def asend(signal, **kwargs):
+    """Signal.asend() on Django 5.0+, send() in a thread otherwise"""
+    if hasattr(signal, 'asend'):
+        return await signal.asend(**kwargs)
+    return await sync_to_async(signal.send)(**kwargs)
+
+
+@contextmanager
+def collect_gone_tokens():
+    """Collect the tokens reported GONE while the block runs instead of
+    unregistering them one by one, so the caller can unregister them in
+    one batch with Pass.unregister_tokens().
+
+    Yields:
+        set: GONE device tokens
+    """
+    gone_tokens = set()
+    reset_token = GONE_TOKENS.set(gone_tokens)
+    try:
+        yield gone_tokens
+    finally:
+        GONE_TOKENS.reset(reset_token)
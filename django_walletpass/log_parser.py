@@ -0,0 +1,138 @@
+"""Parser of the log messages sent by devices to the log endpoint"""
+import datetime
+from collections import namedtuple
+
+from dateutil.parser import parse as datetime_parse
+
+LogRecord = namedtuple('LogRecord', [
+    'created_at',
+    'status',
+    'task_type',
+    'device_id',
+    'pass_type_identifier',
+    'serial_number',
+    'web_service_url',
+    'msg',
+])
+
+# Messages longer than this are not parsed (no device sends one)
+MAX_MESSAGE_LENGTH = 4096
+
+# Literal text between the fields of each format, after the leading '['. Each
+# field ends at the first occurrence of the text that follows it, like the
+# lazy groups of the legacy Log patterns, so serial numbers and urls may
+# contain ',', ';' or ')'. Splitting with str.find() is linear in the message
+# length, the legacy patterns backtrack on crafted messages.
+# [timestamp] Register task (for device X, pass type Y, serial number Z; with web service url U) status: msg
+REGISTER_SEPARATORS = (
+    "] ", " (for device ", ", pass type ", ", serial number ", "; with web service url ", ") ", ": ",
+)
+# [timestamp] Get pass task (pass type Y, serial number Z, if-modified-since (D); with web service url U) status: msg
+GET_SEPARATORS = (
+    "] ", " (pass type ", ", serial number ", ", if-modified-since (", "); with web service url ", ") ", ": ",
+)
+# [timestamp] Web service error for Y (U): msg
+WEB_SERVICE_ERROR_SEPARATORS = ("] ", " for ", " (", "): ")
+
+# Formats sent by iOS, tried before the (slow) generic dateutil parser
+TIMESTAMP_FORMATS = (
+    "%Y-%m-%d %I:%M:%S %p %z",
+    "%Y-%m-%d %H:%M:%S %z",
+)
+
+
+def parse_timestamp(value):
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            pass
+    return datetime_parse(value)
+
+
+def split_fields(message, separators):
+    """Split message on each of separators in turn
+
+    Args:
+        message (str): raw log message
+        separators (tuple): literal text between fields, after the leading '['
+
+    Returns:
+        list: len(separators) + 1 fields, None if message doesn't match
+    """
+    if not message.startswith('['):
+        return None
+    fields = []
+    start = 1
+    for separator in separators:
+        end = message.find(separator, start)
+        if end == -1:
+            return None
+        fields.append(message[start:end])
+        start = end + len(separator)
+    fields.append(message[start:])
+    return fields
+
+
+def get_status(status):
+    if 'error' in status:
+        return 'error'
+    if 'warning' in status:
+        return 'warning'
+    return status
+
+
+def parse_message(message):
+    """Parse a device log message. Formats are tried in the order of the
+    legacy Log patterns (register, get pass, web service error).
+
+    Args:
+        message (str): raw log message
+
+    Returns:
+        LogRecord: None if message doesn't match any known format or is
+            longer than MAX_MESSAGE_LENGTH
+    """
+    if len(message) > MAX_MESSAGE_LENGTH:
+        return None
+    fields = split_fields(message, REGISTER_SEPARATORS)
+    if fields:
+        timestamp, task_type, device_id, pass_type_identifier, serial_number, web_service_url, status, msg = fields
+        return LogRecord(
+            created_at=parse_timestamp(timestamp),
+            status=get_status(status),
+            task_type=task_type,
+            device_id=device_id,
+            pass_type_identifier=pass_type_identifier,
+            serial_number=serial_number,
+            web_service_url=web_service_url,
+            msg=msg,
+        )
+    fields = split_fields(message, GET_SEPARATORS)
+    if fields:
+        timestamp, task_type, pass_type_identifier, serial_number, _if_modified_since, web_service_url, status, msg = \
+            fields
+        return LogRecord(
+            created_at=parse_timestamp(timestamp),
+            status=get_status(status),
+            task_type=task_type,
+            device_id=None,  # 'Get pass task' entries don't include device_id
+            pass_type_identifier=pass_type_identifier,
+            serial_number=serial_number,
+            web_service_url=web_service_url,
+            msg=msg,
+        )
+    fields = split_fields(message, WEB_SERVICE_ERROR_SEPARATORS)
+    if fields:
+        timestamp, task_type, pass_type_identifier, web_service_url, msg = fields
+        return LogRecord(
+            created_at=parse_timestamp(timestamp),
+            status="error",
+            task_type=task_type,
+            device_id=None,
+            pass_type_identifier=pass_type_identifier,
+            serial_number=None,
+            web_service_url=web_service_url,
+            msg=msg,
+        )
+    return None
@@ -0,0 +1,168 @@
+import asyncio
+import resource
+import secrets
+import ssl
+import sys
+import time
+
+from aioapns import APNs
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from django_walletpass import apns_server
+from django_walletpass.models import Pass, Registration
+from django_walletpass.services.push_backend import PushBackend, apns_clients, send_notification_result_signal
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+from django_walletpass.signals import collect_gone_tokens
+
+PUSH_CLASS = 'django_walletpass.management.commands.walletpass_bench_push.LocalPushBackend'
+TARGETS = ('backend', 'pass')
+
+
+class LocalPushBackend(PushBackend):
+    """PushBackend sending to the local server of the running benchmark and
+    recording the latency of every request
+    """
+    server = None
+    latencies = []
+
+    def create_client(self, topic):
+        client = APNs(
+            key=self.server.key_path,
+            key_id='KEYID',
+            team_id='TEAMID',
+            topic=topic,
+            max_connections=WALLETPASS_CONF["PUSH_MAX_CONNECTIONS"],
+            ssl_context=ssl.create_default_context(cafile=self.server.cert_path),
+            err_func=send_notification_result_signal,
+        )
+        client.pool.protocol_class = apns_server.client_protocol_class(self.server.port)
+        return client
+
+    async def send_notification(self, client, token):
+        start = time.perf_counter()
+        try:
+            return await super().send_notification(client, token)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[round(fraction * (len(values) - 1))]
+
+
+def get_max_rss():
+    """Peak resident memory of the process in bytes, since it started: a run
+    only shows its own peak if it is higher than the previous ones
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes but on macOS
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Push throughput of PushBackend and Pass.push_notification against a local APNs stand-in "
+        "(see django_walletpass.apns_server). Registrations are created in a transaction rolled back at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--registrations', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help="Registrations pushed by every run.")
+        parser.add_argument('--target', choices=TARGETS + ('both', ), default='both',
+                            help="backend: PushBackend.push_notification_with_tokens(), "
+                                 "pass: Pass.push_notification() of a pass with every registration.")
+        parser.add_argument('--statuses', default='200=1',
+                            help='Weighted statuses answered by the server, e.g. "200=0.98,410=0.01,429=0.01".')
+        parser.add_argument('--latency', type=float, default=0,
+                            help="Seconds the server waits before answering.")
+        parser.add_argument('--spike-rate', type=float, default=0,
+                            help="Fraction of the responses delayed --spike-latency seconds.")
+        parser.add_argument('--spike-latency', type=float, default=0.5,
+                            help="Seconds of a latency spike.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        plan = apns_server.ResponsePlan(
+            statuses=apns_server.parse_statuses(options['statuses']),
+            latency=options['latency'],
+            spike_rate=options['spike_rate'],
+            spike_latency=options['spike_latency'],
+            seed=options['seed'],
+        )
+        targets = TARGETS if options['target'] == 'both' else (options['target'], )
+        self.stdout.write(
+            f"{'target':<8} {'registrations':>13} {'pushes/s':>10} {'p50 ms':>8} {'p99 ms':>8} "
+            f"{'process peak RSS MB':>19}  statuses"
+        )
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        push_class = WALLETPASS_CONF['WALLETPASS_PUSH_CLASS']
+        try:
+            WALLETPASS_CONF['WALLETPASS_PUSH_CLASS'] = PUSH_CLASS
+            with apns_server.LocalAPNsServer(plan) as server:
+                LocalPushBackend.server = server
+                for registrations in options['registrations']:
+                    for target in targets:
+                        self.run(target, registrations, plan)
+                apns_clients.close()
+        finally:
+            WALLETPASS_CONF['WALLETPASS_PUSH_CLASS'] = push_class
+            LocalPushBackend.server = None
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def run(self, target, registrations, plan):
+        tokens = [secrets.token_hex(32) for _ in range(registrations)]
+        LocalPushBackend.latencies = []
+        counts = plan.counts.copy()
+        if target == 'backend':
+            elapsed = self.push_tokens(tokens)
+        else:
+            elapsed = self.push_pass(tokens)
+        statuses = plan.counts - counts
+        self.stdout.write(
+            f"{target:<8} {registrations:>13} {len(LocalPushBackend.latencies) / elapsed:>10.1f} "
+            f"{percentile(LocalPushBackend.latencies, 0.5) * 1000:>8.2f} "
+            f"{percentile(LocalPushBackend.latencies, 0.99) * 1000:>8.2f} "
+            f"{get_max_rss() / 1024 / 1024:>19.1f}  "
+            + " ".join(f"{status}={count}" for status, count in sorted(statuses.items()))
+        )
+
+    @staticmethod
+    def push_tokens(tokens):
+        backend = LocalPushBackend()
+        # GONE tokens have no registrations to delete
+        with collect_gone_tokens():
+            start = time.perf_counter()
+            backend.push_notification_with_tokens(tokens)
+            elapsed = time.perf_counter() - start
+        return elapsed
+
+    @staticmethod
+    def push_pass(tokens):
+        with transaction.atomic():
+            serial_number = secrets.token_urlsafe(20)
+            Pass.objects.bulk_create([Pass(
+                pass_type_identifier=WALLETPASS_CONF['PASS_TYPE_ID'] or 'pass.benchmark',
+                serial_number=serial_number,
+                authentication_token=secrets.token_urlsafe(20),
+            )])
+            pass_ = Pass.objects.get(serial_number=serial_number)
+            Registration.objects.bulk_create([
+                Registration(
+                    device_library_identifier=f"device{i}",
+                    push_token=token,
+                    push_token_hash=Registration.hash_token(token),
+                    pazz=pass_,
+                )
+                for i, token in enumerate(tokens)
+            ], batch_size=1000)
+            start = time.perf_counter()
+            pass_.push_notification()
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed
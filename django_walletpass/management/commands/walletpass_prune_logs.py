@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_walletpass.services.log_retention import get_cutoff, prune_logs
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class Command(BaseCommand):
+    help = "Delete device logs older than LOG_RETENTION_DAYS, optionally keeping daily rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Days of logs to keep. Defaults to LOG_RETENTION_DAYS.")
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Logs deleted per query.")
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Seconds to wait between chunks.")
+        parser.add_argument('--rollup', action='store_true',
+                            help="Count the logs of every pruned day into LogRollup.")
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = WALLETPASS_CONF['LOG_RETENTION_DAYS']
+        cutoff = get_cutoff(days)
+        total = 0
+        for deleted in prune_logs(cutoff, chunk_size=options['chunk_size'], rollup=options['rollup']):
+            total += deleted
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(f"Deleted {total} logs created before {cutoff:%Y-%m-%d %H:%M}")
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from django_walletpass.services.push_backend import apns_clients
+from django_walletpass.services.push_outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = "Send the push notifications queued in the push outbox (PUSH_OUTBOX)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Entries claimed per batch. Defaults to PUSH_OUTBOX_BATCH_SIZE.")
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help="Seconds to wait when the outbox is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit when there is nothing left to push.")
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                if process_outbox(batch_size=options['batch_size']):
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            apns_clients.close()
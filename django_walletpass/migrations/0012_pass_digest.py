@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0011_alter_log_id_alter_pass_id_alter_registration_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pass',
+            name='digest',
+            field=models.CharField(blank=True, default='', help_text='SHA-1 of manifest.json', max_length=40),
+        ),
+    ]
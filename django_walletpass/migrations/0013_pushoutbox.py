@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0012_pass_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PushOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enqueued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('pazz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='push_outbox', to='django_walletpass.pass')),
+            ],
+            options={
+                'verbose_name_plural': 'push outbox',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0013_pushoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pushoutbox',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pushoutbox',
+            name='coalesced',
+            field=models.PositiveIntegerField(default=0, help_text='Saves merged into this push'),
+        ),
+    ]
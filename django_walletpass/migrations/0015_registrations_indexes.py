@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0014_pushoutbox_debounce'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pass',
+            index=models.Index(fields=['pass_type_identifier', 'updated_at'], name='walletpass_pass_type_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['device_library_identifier', 'pazz'], name='walletpass_reg_device_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0015_registrations_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(blank=True, default='', max_length=100)),
+                ('task_type', models.CharField(blank=True, default='', max_length=255)),
+                ('pass_type_identifier', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['created_at'], name='walletpass_log_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['serial_number'], name='walletpass_log_serial_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='logrollup',
+            unique_together={('day', 'status', 'task_type', 'pass_type_identifier')},
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_registrations(apps, schema_editor):  # pylint: disable=unused-argument
+    """Keep the last registration (latest push token) of every device and pass"""
+    Registration = apps.get_model('django_walletpass', 'Registration')  # pylint: disable=invalid-name
+    duplicates = Registration.objects.values('device_library_identifier', 'pazz').annotate(
+        last_pk=Max('pk'),
+        count=Count('pk'),
+    ).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        Registration.objects.filter(
+            device_library_identifier=duplicate['device_library_identifier'],
+            pazz=duplicate['pazz'],
+        ).exclude(pk=duplicate['last_pk']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0016_log_retention'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_registrations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='registration',
+            constraint=models.UniqueConstraint(fields=('device_library_identifier', 'pazz'), name='walletpass_unique_registration'),
+        ),
+        migrations.RemoveIndex(
+            model_name='registration',
+            name='walletpass_reg_device_idx',
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:38
+
+import hashlib
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def set_push_token_hash(apps, schema_editor):  # pylint: disable=unused-argument
+    Registration = apps.get_model('django_walletpass', 'Registration')  # pylint: disable=invalid-name
+    batch = []
+    for registration in Registration.objects.only('pk', 'push_token').iterator(chunk_size=BATCH_SIZE):
+        registration.push_token_hash = hashlib.sha256(registration.push_token.encode('utf-8')).hexdigest()
+        batch.append(registration)
+        if len(batch) >= BATCH_SIZE:
+            Registration.objects.bulk_update(batch, ['push_token_hash'])
+            batch = []
+    if batch:
+        Registration.objects.bulk_update(batch, ['push_token_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_walletpass', '0017_unique_registration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='push_token_hash',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(set_push_token_hash, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,13 @@
 from .log import Log
+from .log_rollup import LogRollup
 from .mpass import Pass
+from .outbox import PushOutbox
 from .registration import Registration
 
 __all__ = [
   "Log",
+  "LogRollup",
   "Pass",
+  "PushOutbox",
   "Registration",
 ]
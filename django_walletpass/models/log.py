@@ -1,10 +1,11 @@
-import re
-
-from dateutil.parser import parse as datetime_parse
 from django.apps import apps
 from django.db import models
 from django.utils import timezone
 
+from django_walletpass import log_parser
+
+# Legacy patterns, no longer used for parsing (they backtrack on crafted
+# messages), see log_parser
 # pylint: disable=line-too-long
 PATTERN_REGISTER = r"\[(.*?)\]\s(.*?)\s\(for device (.*?), pass type (.*?), serial number (.*?); with web service url (.*?)\)\s(.*?): (.*$)"
 PATTERN_GET = r"\[(.*?)\]\s(.*?)\s\(pass type (.*?), serial number (.*?), if-modified-since \(.*?\); with web service url (.*?)\) (.*?): (.*$)"
@@ -33,54 +34,103 @@ class Log(models.Model):
     def __str__(self):
         return self.created_at.strftime('%d/%m/%y %H:%M:%S')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='walletpass_log_created_idx'),
+            models.Index(fields=['serial_number'], name='walletpass_log_serial_idx'),
+        ]
+
     @classmethod
     def parse_log(cls, log, message):
-        match_register = re.match(PATTERN_REGISTER, message)
-        match_get = re.match(PATTERN_GET, message)
-        match_web_service_error = re.match(PATTERN_WEB_SERVICE_ERROR, message)
-        match_get_warning = re.match(PATTERN_GET_WARNING, message)
-
-        if match_register:
-            timestamp_str, task_type, device_id, pass_type_identifier, serial_number, web_service_url, status, msg = match_register.groups()
-        elif match_get:
-            timestamp_str, task_type, pass_type_identifier, serial_number, web_service_url, status, msg = match_get.groups()
-            device_id = None  # 'Get pass task' entries don't include device_id
-        elif match_web_service_error:
-            timestamp_str, task_type, pass_type_identifier, web_service_url, msg = match_web_service_error.groups()
-            serial_number = None
-            device_id = None
-            status = "error"
-        elif match_get_warning:
-            timestamp_str, task_type, pass_type_identifier, serial_number, web_service_url, status, msg = match_get_warning.groups()
-            device_id = None
-            status = "warning"
-        else:
+        """Parse message into log, link its pass and save it"""
+        cls.parse_message(log, message)
+        cls.resolve_passes([log])
+        log.save()
+
+    @classmethod
+    def from_message(cls, message):
+        """Unsaved Log parsed from a device message. pazz is not resolved, see
+        resolve_passes()
+        """
+        log = cls(message=message)
+        cls.parse_message(log, message)
+        return log
+
+    @classmethod
+    def create_from_messages(cls, messages):
+        """Parse device messages and insert them with one query, plus one
+        query to link their passes.
+
+        Args:
+            messages (list): raw log messages
+
+        Returns:
+            list: created Log instances
+        """
+        logs = [cls.from_message(message) for message in messages]
+        cls.resolve_passes(logs)
+        return cls.objects.bulk_create(logs)
+
+    @staticmethod
+    def parse_message(log, message):
+        log.message = message
+        record = log_parser.parse_message(message)
+        if record is None:
             log.status = 'unknown'
-            log.message = message
-            log.save()
             return  # Log entry didn't match any known pattern
 
-        if 'error' in status:
-            status = 'error'
-        elif 'warning' in status:
-            status = 'warning'
-
-        log.created_at = datetime_parse(timestamp_str)
-        log.status = status
-        log.task_type = task_type
-        log.device_id = device_id
-        log.pass_type_identifier = pass_type_identifier
-        log.serial_number = serial_number
-        log.web_service_url = web_service_url
-        log.msg = msg
-        log.message = message
+        log.created_at = record.created_at
+        log.status = record.status
+        log.task_type = record.task_type
+        log.device_id = record.device_id
+        log.pass_type_identifier = record.pass_type_identifier
+        log.serial_number = record.serial_number
+        log.web_service_url = record.web_service_url
+        log.msg = record.msg
 
-        if serial_number:
-            Pass = apps.get_model('django_walletpass', 'Pass')  # pylint: disable=invalid-name
-            try:
-                pazz = Pass.objects.get(serial_number=serial_number)
-                log.pazz = pazz
-            except Pass.DoesNotExist:
-                pass
+    @classmethod
+    async def acreate_from_messages(cls, messages):
+        """Async version of create_from_messages()"""
+        logs = [cls.from_message(message) for message in messages]
+        await cls.aresolve_passes(logs)
+        return await cls.objects.abulk_create(logs)
 
-        log.save()
+    @classmethod
+    def resolve_passes(cls, logs):
+        """Set pazz of every log with a serial number, with one query. When a
+        serial number is used by several pass types the one of the log wins.
+        """
+        queryset = cls._get_passes_queryset(logs)
+        if queryset is not None:
+            cls._link_passes(logs, queryset)
+
+    @classmethod
+    async def aresolve_passes(cls, logs):
+        """Async version of resolve_passes()"""
+        queryset = cls._get_passes_queryset(logs)
+        if queryset is not None:
+            cls._link_passes(logs, [row async for row in queryset])
+
+    @staticmethod
+    def _get_passes_queryset(logs):
+        serial_numbers = {log.serial_number for log in logs if log.serial_number}
+        if not serial_numbers:
+            return None
+        Pass = apps.get_model('django_walletpass', 'Pass')  # pylint: disable=invalid-name
+        return Pass.objects.filter(
+            serial_number__in=serial_numbers,
+        ).values_list('pk', 'pass_type_identifier', 'serial_number')
+
+    @staticmethod
+    def _link_passes(logs, rows):
+        passes = {}
+        for pk, pass_type_identifier, serial_number in rows:
+            passes.setdefault(serial_number, {})[pass_type_identifier] = pk
+        for log in logs:
+            by_type = passes.get(log.serial_number)
+            if not by_type:
+                continue
+            if log.pass_type_identifier in by_type:
+                log.pazz_id = by_type[log.pass_type_identifier]
+            elif len(by_type) == 1:
+                log.pazz_id = next(iter(by_type.values()))
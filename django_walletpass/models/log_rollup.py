@@ -0,0 +1,24 @@
+from django.db import models
+
+
+class LogRollup(models.Model):
+    """
+    Number of device logs of a day per status, task type and pass type, kept
+    when raw logs are pruned (see walletpass_prune_logs)
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=100, blank=True, default='')
+    task_type = models.CharField(max_length=255, blank=True, default='')
+    pass_type_identifier = models.CharField(max_length=255, blank=True, default='')
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.status} {self.task_type}: {self.count}"
+
+    class Meta:
+        unique_together = (
+            'day',
+            'status',
+            'task_type',
+            'pass_type_identifier',
+        )
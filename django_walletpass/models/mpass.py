@@ -1,6 +1,10 @@
+from aioapns.common import APNS_RESPONSE_CODE
+from asgiref.sync import sync_to_async
 from django.db import models
 from django.utils.module_loading import import_string
 
+from django_walletpass.dispatch import PASS_UNREGISTERED, collect_gone_tokens
+from django_walletpass.models.registration import Registration
 from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
 from django_walletpass.storage import WalletPassStorage
 
@@ -17,18 +21,109 @@ class Pass(models.Model):
         storage=WalletPassStorage(),
     )
     updated_at = models.DateTimeField(auto_now=True)
+    digest = models.CharField(max_length=40, blank=True, default='', help_text="SHA-1 of manifest.json")
+
+    # Field values recorded by mark_unchanged(), see save()
+    _unchanged_state = None
+
+    def save(self, *args, **kwargs):
+        unchanged_state, self._unchanged_state = self._unchanged_state, None
+        if unchanged_state is not None and unchanged_state == self._get_field_state():
+            # Nothing to update: don't bump updated_at nor send post_save
+            # (and its push notifications).
+            return
+        super().save(*args, **kwargs)
+
+    def mark_unchanged(self):
+        """Skip the next save() unless a field is modified before it. Used by
+        PassBuilder.write_to_model() when the rebuilt pass is the same as the
+        stored one.
+        """
+        self._unchanged_state = self._get_field_state()
+
+    def _get_field_state(self):
+        return [field.value_to_string(self) for field in self._meta.concrete_fields]
 
     def get_registrations(self):
         return self.registrations.all()
 
     def push_notification(self):
+        """Push to every registration concurrently and unregister, in one
+        batch, the tokens reported 410 GONE.
+        """
+        registrations = list(self.get_registrations())
+        if registrations:
+            self.push_registrations(registrations)
+
+    async def apush_notification(self):
+        """Async version of push_notification()"""
+        registrations = [registration async for registration in self.get_registrations()]
+        if registrations:
+            await self.apush_registrations(registrations)
+
+    @staticmethod
+    def push_registrations(registrations):
+        """Push to registrations with WALLETPASS_PUSH_CLASS and unregister, in
+        one batch, the tokens reported 410 GONE (see unregister_tokens()).
+
+        Args:
+            registrations (list): Registration instances
+
+        Returns:
+            list: responses (None on error), in the order of registrations
+        """
+        klass = import_string(WALLETPASS_CONF['WALLETPASS_PUSH_CLASS'])
+        push_module = klass()
+        with collect_gone_tokens() as gone_tokens:
+            if hasattr(push_module, 'push_notification_from_instances'):
+                responses = push_module.push_notification_from_instances(registrations)
+            else:
+                responses = [
+                    push_module.push_notification_from_instance(registration)
+                    for registration in registrations
+                ]
+        gone_tokens.update(Pass._get_gone_tokens(registrations, responses))
+        if gone_tokens:
+            Pass.unregister_tokens(gone_tokens)
+        return responses
+
+    @staticmethod
+    async def apush_registrations(registrations):
+        """Async version of push_registrations(). Push backends without
+        apush_notification_from_instances() run in a thread.
+        """
         klass = import_string(WALLETPASS_CONF['WALLETPASS_PUSH_CLASS'])
         push_module = klass()
-        for registration in self.get_registrations():
-            response = push_module.push_notification_from_instance(registration)
-            # delete invalid registration
-            if response.status == '410':
-                registration.delete()
+        if not hasattr(push_module, 'apush_notification_from_instances'):
+            return await sync_to_async(Pass.push_registrations)(registrations)
+        with collect_gone_tokens() as gone_tokens:
+            responses = await push_module.apush_notification_from_instances(registrations)
+        gone_tokens.update(Pass._get_gone_tokens(registrations, responses))
+        if gone_tokens:
+            await sync_to_async(Pass.unregister_tokens)(gone_tokens)
+        return responses
+
+    @classmethod
+    def unregister_tokens(cls, push_tokens):
+        """Delete every registration of push_tokens and send PASS_UNREGISTERED
+        once per affected pass
+
+        Args:
+            push_tokens (iterable): device tokens
+        """
+        pass_ids = Registration.unregister_tokens(push_tokens)
+        if not pass_ids:
+            return
+        for pass_ in cls.objects.filter(pk__in=pass_ids):
+            PASS_UNREGISTERED.send(sender=pass_)
+
+    @staticmethod
+    def _get_gone_tokens(registrations, responses):
+        return {
+            registration.push_token
+            for registration, response in zip(registrations, responses)
+            if response is not None and response.status == APNS_RESPONSE_CODE.GONE
+        }
 
     def __unicode__(self):
         return self.serial_number
@@ -42,3 +137,7 @@ class Pass(models.Model):
             'pass_type_identifier',
             'serial_number',
         )
+        indexes = [
+            # RegistrationsViewSet.list
+            models.Index(fields=['pass_type_identifier', 'updated_at'], name='walletpass_pass_type_upd_idx'),
+        ]
@@ -0,0 +1,80 @@
+import datetime
+
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from django_walletpass import stats
+
+
+class PushOutbox(models.Model):
+    """
+    Pending push notification of a Pass, sent by the walletpass_push_worker
+    command when PUSH_OUTBOX is enabled
+    """
+    pazz = models.ForeignKey("Pass", on_delete=models.CASCADE, related_name='push_outbox')
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    coalesced = models.PositiveIntegerField(default=0, help_text="Saves merged into this push")
+    last_error = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.pazz_id} @ {self.enqueued_at:%d/%m/%y %H:%M:%S}"
+
+    class Meta:
+        verbose_name_plural = "push outbox"
+
+    @classmethod
+    def enqueue(cls, pazz, delay=0):
+        """Schedule a push of pazz in delay seconds. If the pass already has an
+        entry waiting to be claimed the save is merged into it instead: every
+        save in the window is sent with one push per registration, and the
+        "push_suppressed" counter (see stats) is incremented.
+
+        Args:
+            pazz (Pass): saved pass
+            delay (float, optional): debounce window in seconds. Defaults to 0.
+
+        Returns:
+            PushOutbox: created entry, None if the save was merged
+        """
+        merged = cls.objects.filter(pazz=pazz, claimed_at__isnull=True).update(
+            coalesced=F('coalesced') + 1,
+        )
+        if merged:
+            stats.incr('push_suppressed')
+            return None
+        return cls.objects.create(
+            pazz=pazz,
+            next_attempt_at=timezone.now() + datetime.timedelta(seconds=delay),
+        )
+
+    @classmethod
+    def claim(cls, batch_size, lease):
+        """Claim up to batch_size due entries. Rows locked by another worker
+        are skipped (SELECT ... FOR UPDATE SKIP LOCKED) and claimed ones are
+        hidden from other workers for lease seconds: if the worker dies
+        before deleting them they are pushed again (at least once). Saves
+        after the claim enqueue a new entry.
+
+        Args:
+            batch_size (int): max entries to claim
+            lease (float): seconds before the entries can be claimed again
+
+        Returns:
+            list: claimed PushOutbox instances
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            entries = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(next_attempt_at__lte=now)
+                .order_by('next_attempt_at')[:batch_size]
+            )
+            cls.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+                claimed_at=now,
+                next_attempt_at=now + datetime.timedelta(seconds=lease),
+            )
+        return entries
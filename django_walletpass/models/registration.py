@@ -1,4 +1,7 @@
-from django.db import models
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
 
 
 class Registration(models.Model):
@@ -7,6 +10,8 @@ class Registration(models.Model):
     """
     device_library_identifier = models.CharField(max_length=150)
     push_token = models.TextField()
+    # SHA-256 of push_token, indexed to find registrations by token
+    push_token_hash = models.CharField(max_length=64, db_index=True, default='', editable=False)
     pazz = models.ForeignKey(
         "Pass",
         on_delete=models.CASCADE,
@@ -18,3 +23,110 @@ class Registration(models.Model):
 
     def __str__(self):
         return str(self.device_library_identifier)
+
+    def save(self, *args, **kwargs):
+        self.push_token_hash = self.hash_token(self.push_token)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'push_token' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'push_token_hash'}
+        super().save(*args, **kwargs)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['device_library_identifier', 'pazz'],
+                name='walletpass_unique_registration',
+            ),
+        ]
+
+    @staticmethod
+    def hash_token(push_token):
+        return hashlib.sha256(push_token.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def register(cls, device_library_identifier, pazz_id, push_token):
+        """Register a device for a pass, or update the push token of an
+        existing registration. One UPDATE when the device is registered.
+
+        Returns:
+            bool: True if the registration was created
+        """
+        updated = cls.objects.filter(
+            device_library_identifier=device_library_identifier,
+            pazz_id=pazz_id,
+        ).update(push_token=push_token, push_token_hash=cls.hash_token(push_token))
+        if updated:
+            return False
+        return cls._insert(device_library_identifier, pazz_id, push_token)
+
+    @classmethod
+    async def aregister(cls, device_library_identifier, pazz_id, push_token):
+        """Async version of register()"""
+        updated = await cls.objects.filter(
+            device_library_identifier=device_library_identifier,
+            pazz_id=pazz_id,
+        ).aupdate(push_token=push_token, push_token_hash=cls.hash_token(push_token))
+        if updated:
+            return False
+        # transaction.atomic() can't be used from async code
+        return await sync_to_async(cls._insert)(device_library_identifier, pazz_id, push_token)
+
+    @classmethod
+    def _insert(cls, device_library_identifier, pazz_id, push_token):
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    device_library_identifier=device_library_identifier,
+                    pazz_id=pazz_id,
+                    push_token=push_token,
+                )
+        except IntegrityError:
+            # registered concurrently
+            cls.objects.filter(
+                device_library_identifier=device_library_identifier,
+                pazz_id=pazz_id,
+            ).update(push_token=push_token, push_token_hash=cls.hash_token(push_token))
+            return False
+        return True
+
+    @classmethod
+    def unregister(cls, device_library_identifier, pazz_id):
+        """Delete the registration of a device for a pass with one DELETE
+
+        Returns:
+            bool: True if the device was registered
+        """
+        deleted, _rows = cls.objects.filter(
+            device_library_identifier=device_library_identifier,
+            pazz_id=pazz_id,
+        ).delete()
+        return bool(deleted)
+
+    @classmethod
+    async def aunregister(cls, device_library_identifier, pazz_id):
+        """Async version of unregister()"""
+        deleted, _rows = await cls.objects.filter(
+            device_library_identifier=device_library_identifier,
+            pazz_id=pazz_id,
+        ).adelete()
+        return bool(deleted)
+
+    @classmethod
+    def unregister_tokens(cls, push_tokens):
+        """Delete, with one DELETE, every registration of push_tokens (e.g.
+        reported 410 GONE by APNs). A device token is shared by all the passes
+        registered on the device.
+
+        Args:
+            push_tokens (iterable): device tokens
+
+        Returns:
+            set: pk of every pass that lost a registration
+        """
+        registrations = cls.objects.filter(
+            push_token_hash__in={cls.hash_token(push_token) for push_token in push_tokens},
+        )
+        pass_ids = set(registrations.values_list('pazz_id', flat=True))
+        if pass_ids:
+            registrations.delete()
+        return pass_ids
@@ -0,0 +1,119 @@
+"""Cache of the Pass fields device endpoints need, see get_pass().
+
+Entries are only invalidated by the post_save/post_delete signals of Pass and
+by bulk_update_passes(). Writes that skip them, such as QuerySet.update(),
+QuerySet.delete(), bulk_update() or raw SQL, leave stale entries for up to
+PASS_CACHE_TIMEOUT seconds; call invalidate_on_commit() for each pass they
+change.
+"""
+import hashlib
+from collections import namedtuple
+from functools import partial
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from django_walletpass.models import Pass
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+KEY_PREFIX = 'walletpass:pass:'
+
+# Same attribute names as Pass, so views can use either of them
+CachedPass = namedtuple('CachedPass', ['pk', 'authentication_token', 'updated_at', 'digest'])
+
+
+def _get_cache():
+    alias = WALLETPASS_CONF['PASS_CACHE']
+    return caches[alias] if alias else None
+
+
+def _get_cache_value(pass_):
+    return (pass_.pk, pass_.authentication_token, pass_.updated_at, pass_.digest)
+
+
+def get_key(pass_type_id, serial_number):
+    # serial numbers may contain chars not allowed in memcached keys
+    digest = hashlib.sha1(f"{pass_type_id}\n{serial_number}".encode('utf-8')).hexdigest()
+    return KEY_PREFIX + digest
+
+
+def get_pass(pass_type_id, serial_number):
+    """Read-through lookup of the fields device endpoints need to authenticate
+    a request and answer conditional GETs. Disabled unless PASS_CACHE is set
+    to a cache alias.
+
+    Raises:
+        Http404: no such pass
+
+    Returns:
+        CachedPass or Pass: the Pass instance itself on cache misses
+    """
+    cache = _get_cache()
+    key = get_key(pass_type_id, serial_number)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return CachedPass(*cached)
+
+    pass_ = get_object_or_404(Pass, pass_type_identifier=pass_type_id, serial_number=serial_number)
+    if cache is not None:
+        cache.set(
+            key,
+            _get_cache_value(pass_),
+            WALLETPASS_CONF['PASS_CACHE_TIMEOUT'],
+        )
+    return pass_
+
+
+async def aget_pass(pass_type_id, serial_number):
+    """Async version of get_pass()"""
+    cache = _get_cache()
+    key = get_key(pass_type_id, serial_number)
+    if cache is not None:
+        cached = await cache.aget(key)
+        if cached is not None:
+            return CachedPass(*cached)
+
+    try:
+        pass_ = await Pass.objects.aget(pass_type_identifier=pass_type_id, serial_number=serial_number)
+    except Pass.DoesNotExist as e:
+        raise Http404("No Pass matches the given query.") from e
+    if cache is not None:
+        await cache.aset(
+            key,
+            _get_cache_value(pass_),
+            WALLETPASS_CONF['PASS_CACHE_TIMEOUT'],
+        )
+    return pass_
+
+
+def get_instance(pass_):
+    """Pass instance of a get_pass() result, loaded if it came from the cache"""
+    if isinstance(pass_, Pass):
+        return pass_
+    return get_object_or_404(Pass, pk=pass_.pk)
+
+
+async def aget_instance(pass_):
+    """Async version of get_instance()"""
+    if isinstance(pass_, Pass):
+        return pass_
+    try:
+        return await Pass.objects.aget(pk=pass_.pk)
+    except Pass.DoesNotExist as e:
+        raise Http404("No Pass matches the given query.") from e
+
+
+def invalidate(pass_type_id, serial_number):
+    cache = _get_cache()
+    if cache is not None:
+        cache.delete(get_key(pass_type_id, serial_number))
+
+
+def invalidate_on_commit(pass_type_id, serial_number):
+    """invalidate() once the current transaction commits. Invalidating before
+    would let a concurrent request cache the old row again.
+    """
+    transaction.on_commit(partial(invalidate, pass_type_id, serial_number))
@@ -1,7 +1,18 @@
 from .pass_builder import PassBuilder
-from .push_backend import PushBackend
+from .bulk import build_many, bulk_create_passes, bulk_update_passes
+from .push_backend import PushBackend, PushResult
+from .push_fanout import push_passes
+from .push_outbox import process_outbox
+from .template_cache import template_cache
 
 __all__ = [
+  "build_many",
+  "bulk_create_passes",
+  "bulk_update_passes",
   "PassBuilder",
+  "process_outbox",
+  "push_passes",
   "PushBackend",
+  "PushResult",
+  "template_cache",
 ]
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import os
+import struct
+import zipfile
+import zlib
+
+# -rw-r--r--
+FILE_MODE = 0o644 << 16
+
+# Archives are written with these structs instead of zipfile's writer, whose
+# internals would be needed to add already deflated members. Members are
+# deflated, without data descriptor nor zip64 extensions (APPNOTE.TXT 4.3).
+LOCAL_FILE_HEADER = struct.Struct('<4s2B4HL2L2H')
+CENTRAL_DIRECTORY_HEADER = struct.Struct('<4s4B4HL2L5H2L')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<4s4H2LH')
+# 2.0: deflate
+ZIP_VERSION = 20
+# Unix, so external attributes are read as file modes
+CREATE_SYSTEM = 3
+# Filename encoded in UTF-8
+FLAG_UTF8 = 0x800
+ZIP32_LIMIT = 0xFFFFFFFF
+MAX_ENTRIES = 0xFFFF
+
+
+def deflate(content):
+    """Compress content with the same raw deflate settings used by zipfile
+
+    Args:
+        content (bytes): data to compress
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(content) + compressor.flush()
+
+
+class ArchiveEntry:
+    """Member of a .pkpass archive kept with its SHA-1 digest and its deflated
+    stream, so it can be added to the manifest and zipped without hashing or
+    compressing it again.
+    """
+    __slots__ = ('_sha1', 'crc', 'size', 'compressed', '_content')
+
+    def __init__(self, sha1, crc, size, compressed, content=None):
+        self._sha1 = sha1
+        self.crc = crc
+        self.size = size
+        self.compressed = compressed
+        self._content = content
+
+    @classmethod
+    def from_content(cls, content):
+        return cls(
+            sha1=hashlib.sha1(content).hexdigest(),
+            crc=zlib.crc32(content),
+            size=len(content),
+            compressed=deflate(content),
+            content=content,
+        )
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = zlib.decompress(self.compressed, -15)
+        return self._content
+
+    @property
+    def sha1(self):
+        if self._sha1 is None:
+            self._sha1 = hashlib.sha1(self.content).hexdigest()
+        return self._sha1
+
+    @sha1.setter
+    def sha1(self, value):
+        self._sha1 = value
+
+
+def is_safe_path(arcname):
+    """False for absolute member paths or paths going out of the archive root"""
+    path = os.path.normpath(arcname)
+    return not (os.path.isabs(path) or path == '..' or path.startswith('..' + os.sep))
+
+
+def read_entries(content):
+    """Read the members of a zip archive without decompressing them. Deflated
+    members keep their compressed stream, so they can be written again with
+    write_archive() as they are. SHA-1 digests are computed on first access.
+
+    Directories and unsafe paths (see is_safe_path) are skipped.
+
+    Args:
+        content (bytes): zip archive content
+
+    Returns:
+        dict: relative path -> ArchiveEntry, in archive order
+    """
+    entries = {}
+    with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+        for zinfo in zip_file.infolist():
+            if zinfo.is_dir() or not is_safe_path(zinfo.filename):
+                continue
+            if zinfo.compress_type != zipfile.ZIP_DEFLATED or zinfo.flag_bits & 0x1:
+                entries[zinfo.filename] = ArchiveEntry.from_content(zip_file.read(zinfo))
+                continue
+            header_end = zinfo.header_offset + LOCAL_FILE_HEADER.size
+            header = LOCAL_FILE_HEADER.unpack(content[zinfo.header_offset:header_end])
+            # filename length and extra field length
+            start = header_end + header[10] + header[11]
+            entries[zinfo.filename] = ArchiveEntry(
+                sha1=None,
+                crc=zinfo.CRC,
+                size=zinfo.file_size,
+                compressed=content[start:start + zinfo.compress_size],
+            )
+    return entries
+
+
+def get_dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time[:6]
+    return (year - 1980) << 9 | month << 5 | day, hour << 11 | minute << 5 | second // 2
+
+
+def write_archive(files, date_time):
+    """Zip files into memory, sorted by path, and return the content of the
+    archive. ArchiveEntry members are written with their deflated stream.
+
+    Args:
+        files (dict): relative path -> content (bytes or ArchiveEntry)
+        date_time (tuple): date_time set on every member
+
+    Raises:
+        ValueError: the archive would need zip64 extensions
+
+    Returns:
+        bytes: zip archive content
+    """
+    if len(files) > MAX_ENTRIES:
+        raise ValueError(f"Archives of more than {MAX_ENTRIES} files aren't supported")
+    dos_date, dos_time = get_dos_date_time(date_time)
+    buffer = io.BytesIO()
+    central_directory = []
+    for arcname in sorted(files):
+        entry = files[arcname]
+        if not isinstance(entry, ArchiveEntry):
+            entry = ArchiveEntry(sha1=None, crc=zlib.crc32(entry), size=len(entry), compressed=deflate(entry))
+        try:
+            filename, flag_bits = arcname.encode('ascii'), 0
+        except UnicodeEncodeError:
+            filename, flag_bits = arcname.encode('utf-8'), FLAG_UTF8
+        offset = buffer.tell()
+        if max(offset, entry.size, len(entry.compressed)) > ZIP32_LIMIT:
+            raise ValueError("Archives over 4 GiB aren't supported")
+        buffer.write(LOCAL_FILE_HEADER.pack(
+            b'PK\x03\x04', ZIP_VERSION, 0, flag_bits, zipfile.ZIP_DEFLATED, dos_time, dos_date,
+            entry.crc, len(entry.compressed), entry.size, len(filename), 0,
+        ))
+        buffer.write(filename)
+        buffer.write(entry.compressed)
+        central_directory.append(CENTRAL_DIRECTORY_HEADER.pack(
+            b'PK\x01\x02', ZIP_VERSION, CREATE_SYSTEM, ZIP_VERSION, 0, flag_bits, zipfile.ZIP_DEFLATED,
+            dos_time, dos_date, entry.crc, len(entry.compressed), entry.size, len(filename), 0, 0, 0, 0,
+            FILE_MODE, offset,
+        ) + filename)
+    central_directory_offset = buffer.tell()
+    if central_directory_offset > ZIP32_LIMIT:
+        raise ValueError("Archives over 4 GiB aren't supported")
+    central_directory = b''.join(central_directory)
+    buffer.write(central_directory)
+    buffer.write(END_OF_CENTRAL_DIRECTORY.pack(
+        b'PK\x05\x06', 0, 0, len(files), len(files), len(central_directory), central_directory_offset, 0,
+    ))
+    return buffer.getvalue()
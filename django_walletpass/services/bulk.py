@@ -0,0 +1,277 @@
+import functools
+import itertools
+import os
+import uuid
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.db import DatabaseError
+from django.utils import timezone
+
+from django_walletpass import pass_cache
+from django_walletpass.files import WalletpassContentFile
+from django_walletpass.models import Pass
+from django_walletpass.services.pass_builder import PassBuilder
+from django_walletpass.services.push_fanout import get_push_tokens, push_tokens
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+DEFAULT_CHUNKSIZE = 50
+DEFAULT_BATCH_SIZE = 500
+
+BuildResult = namedtuple('BuildResult', [
+    'index',
+    'serial_number',
+    'authentication_token',
+    'digest',
+    'content',
+])
+
+RebuildResult = namedtuple('RebuildResult', [
+    'pk',
+    'digest',
+    # None when the rebuilt pass is the same as the stored one
+    'content',
+])
+
+
+def build_from_spec(spec):
+    """Build a .pkpass from a spec dict. Supported keys (all optional):
+
+    - directory: base directory, as in PassBuilder(directory=...)
+    - pass_data: dict merged into builder.pass_data
+    - pass_data_required: dict merged into builder.pass_data_required
+    - extra_files: dict of path -> content added with builder.add_file()
+
+    Returns:
+        PassBuilder: already built builder
+    """
+    builder = PassBuilder(directory=spec.get('directory'))
+    builder.pass_data.update(spec.get('pass_data', {}))
+    builder.pass_data_required.update(spec.get('pass_data_required', {}))
+    for path, content in spec.get('extra_files', {}).items():
+        builder.add_file(path, content)
+    builder.build()
+    return builder
+
+
+def _build_chunk(chunk):
+    results = []
+    for index, spec in chunk:
+        builder = build_from_spec(spec)
+        results.append(BuildResult(
+            index=index,
+            serial_number=builder.pass_data_required['serialNumber'],
+            authentication_token=builder.pass_data_required['authenticationToken'],
+            digest=builder.digest,
+            content=builder.builded_pass_content,
+        ))
+    return results
+
+
+def _rebuild_chunk(chunk, mutate_fn):
+    results = []
+    for _index, item in chunk:
+        builder = PassBuilder.read_from_archive(item['content'], incremental=True)
+        builder.pass_data_required.update(item['pass_data_required'])
+        mutate_fn(builder.pass_data)
+        builder.build()
+        changed = builder.digest != item['digest']
+        results.append(RebuildResult(
+            pk=item['pk'],
+            digest=builder.digest,
+            content=builder.builded_pass_content if changed else None,
+        ))
+    return results
+
+
+def _chunks(specs, chunksize):
+    iterator = enumerate(specs)
+    while True:
+        chunk = list(itertools.islice(iterator, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_many(specs, workers=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Build passes in parallel over a process pool.
+
+    Specs (see build_from_spec) are sent to the workers in chunks and results
+    are yielded as soon as their chunk completes, so they are not ordered:
+    BuildResult.index is the position of the spec in specs. At most two chunks
+    per worker are in flight, specs can be a lazy iterable.
+
+    Args:
+        specs (iterable): pass specs
+        workers (int, optional): number of processes, os.cpu_count() if None.
+            With 1 passes are built in the current process. Defaults to None.
+        chunksize (int, optional): specs per task. Defaults to DEFAULT_CHUNKSIZE.
+
+    Yields:
+        BuildResult: built pass
+    """
+    yield from _map_chunks(_build_chunk, _chunks(specs, chunksize), workers)
+
+
+def _map_chunks(func, chunks, workers=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+
+    # Workers started with spawn/forkserver need the app registry ready
+    # before unpickling tasks that import models.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        pending = set()
+        for chunk in itertools.islice(chunks, workers * 2):
+            pending.add(executor.submit(func, chunk))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+                for chunk in itertools.islice(chunks, 1):
+                    pending.add(executor.submit(func, chunk))
+
+
+def bulk_create_passes(results, batch_size=DEFAULT_BATCH_SIZE):
+    """Save built passes to storage and insert their Pass rows with
+    bulk_create, batch_size rows per query. Like QuerySet.bulk_create(),
+    post_save is not sent.
+
+    Args:
+        results (iterable): BuildResult, e.g. from build_many()
+        batch_size (int, optional): rows per INSERT. Defaults to DEFAULT_BATCH_SIZE.
+
+    Raises:
+        DatabaseError: the INSERT of a batch failed (e.g. duplicated serial
+            number). The stored files of that batch are deleted first.
+
+    Yields:
+        Pass: created instances, once their batch is inserted. On databases
+        that don't return the pks of bulk inserted rows (e.g. MySQL) the rows
+        are selected again, so instances always have a pk.
+    """
+    batch = []
+    for result in results:
+        instance = Pass(
+            pass_type_identifier=WALLETPASS_CONF['PASS_TYPE_ID'],
+            serial_number=result.serial_number,
+            authentication_token=result.authentication_token,
+            digest=result.digest,
+        )
+        instance.data.save(
+            f"{uuid.uuid1()}.pkpass",
+            WalletpassContentFile(result.content),
+            save=False,
+        )
+        batch.append(instance)
+        if len(batch) >= batch_size:
+            yield from _bulk_create(batch)
+            batch = []
+    if batch:
+        yield from _bulk_create(batch)
+
+
+def _bulk_create(batch):
+    try:
+        created = Pass.objects.bulk_create(batch)
+    except DatabaseError:
+        # don't leave the files of rows that weren't inserted in storage
+        for instance in batch:
+            instance.data.delete(save=False)
+        raise
+    if all(instance.pk is not None for instance in created):
+        return created
+    instances = {
+        instance.serial_number: instance
+        for instance in Pass.objects.filter(
+            pass_type_identifier=WALLETPASS_CONF['PASS_TYPE_ID'],
+            serial_number__in=[instance.serial_number for instance in batch],
+        )
+    }
+    return [instances[instance.serial_number] for instance in batch]
+
+
+def bulk_update_passes(queryset, mutate_fn, *, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+                       batch_size=DEFAULT_BATCH_SIZE, push=True):
+    """Apply mutate_fn to the pass.json of every pass of queryset and push
+    the changes once.
+
+    Stored archives are rebuilt incrementally (see PassBuilder.read_from_model)
+    and signed over a process pool like build_many(). Changed files are written
+    to storage and their rows updated with bulk_update, batch_size rows per
+    query, all with the same updated_at. Passes whose rebuilt manifest is the
+    same as the stored one are left untouched. post_save isn't sent, cached
+    passes are invalidated and, at the end, every distinct device token of the
+    changed passes is pushed once (see push_passes).
+
+    Args:
+        queryset (QuerySet): passes to update
+        mutate_fn (callable): called with the pass.json dict to change it in
+            place. With several workers it must be picklable (e.g. a module
+            level function).
+        workers (int, optional): number of processes, see build_many().
+            Defaults to None.
+        chunksize (int, optional): passes per task. Defaults to DEFAULT_CHUNKSIZE.
+        batch_size (int, optional): rows per UPDATE. Defaults to DEFAULT_BATCH_SIZE.
+        push (bool, optional): push the changed passes. Defaults to True.
+
+    Returns:
+        int: number of changed passes
+    """
+    pending = {}
+
+    def iter_items():
+        for instance in queryset.iterator(chunk_size=batch_size):
+            with instance.data.open('rb'):
+                content = instance.data.read()
+            pending[instance.pk] = instance
+            yield {
+                'pk': instance.pk,
+                'content': content,
+                'digest': instance.digest,
+                'pass_data_required': {
+                    "passTypeIdentifier": instance.pass_type_identifier,
+                    "serialNumber": instance.serial_number,
+                    "authenticationToken": instance.authentication_token,
+                },
+            }
+
+    rebuild = functools.partial(_rebuild_chunk, mutate_fn=mutate_fn)
+    updated_at = timezone.now()
+    tokens = defaultdict(set)
+    updated = 0
+    batch = []
+    for result in _map_chunks(rebuild, _chunks(iter_items(), chunksize), workers):
+        instance = pending.pop(result.pk)
+        if result.content is None:
+            continue
+        if instance.data.name:
+            filename = os.path.basename(instance.data.name)
+        else:
+            filename = f"{uuid.uuid1()}.pkpass"
+        instance.data.delete(save=False)
+        instance.data.save(filename, WalletpassContentFile(result.content), save=False)
+        instance.digest = result.digest
+        instance.updated_at = updated_at
+        batch.append(instance)
+        if len(batch) >= batch_size:
+            updated += _update_batch(batch, tokens if push else None)
+            batch = []
+    if batch:
+        updated += _update_batch(batch, tokens if push else None)
+    if tokens:
+        push_tokens(tokens)
+    return updated
+
+
+def _update_batch(batch, tokens):
+    Pass.objects.bulk_update(batch, ['data', 'digest', 'updated_at'])
+    for instance in batch:
+        pass_cache.invalidate_on_commit(instance.pass_type_identifier, instance.serial_number)
+    if tokens is not None:
+        for topic, topic_tokens in get_push_tokens([instance.pk for instance in batch]).items():
+            tokens[topic].update(topic_tokens)
+    return len(batch)
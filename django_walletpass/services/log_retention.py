@@ -0,0 +1,73 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from django_walletpass.models import Log, LogRollup
+
+
+def get_cutoff(days):
+    """Start of the day, in the current timezone, days days ago"""
+    return get_day_start(timezone.localdate() - datetime.timedelta(days=days))
+
+
+def get_day_start(day):
+    """Start of day in the current timezone"""
+    start = datetime.datetime.combine(day, datetime.time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def _add_count(day, count, **fields):
+    updated = LogRollup.objects.filter(day=day, **fields).update(count=F('count') + count)
+    if not updated:
+        LogRollup.objects.create(day=day, count=count, **fields)
+
+
+def _rollup(logs):
+    rows = (
+        logs.annotate(day=TruncDate('created_at'))
+        .values('day', 'status', 'task_type', 'pass_type_identifier')
+        .annotate(count=Count('pk'))
+        .order_by()
+    )
+    for row in rows:
+        _add_count(
+            row['day'],
+            status=row['status'] or '',
+            task_type=row['task_type'] or '',
+            pass_type_identifier=row['pass_type_identifier'] or '',
+            count=row['count'],
+        )
+
+
+def prune_logs(before, chunk_size=10000, rollup=False):
+    """Delete logs created before before, chunk_size rows per DELETE so locks
+    and transactions stay short.
+
+    With rollup, the logs of every chunk are counted per day, status, task
+    type and pass type into LogRollup in the transaction that deletes them,
+    so a failed or interrupted run never counts a log twice. Counts are added
+    to the existing LogRollup rows, so logs received late for an already
+    rolled up day are counted too.
+
+    Args:
+        before (datetime): logs created before are deleted, see get_cutoff()
+        chunk_size (int, optional): rows per DELETE. Defaults to 10000.
+        rollup (bool, optional): count deleted logs into LogRollup. Defaults to False.
+
+    Yields:
+        int: deleted rows of every chunk
+    """
+    while True:
+        with transaction.atomic():
+            pks = list(Log.objects.filter(created_at__lt=before).values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return
+            logs = Log.objects.filter(pk__in=pks)
+            if rollup:
+                _rollup(logs)
+            deleted, _rows = logs.delete()
+        yield deleted
@@ -0,0 +1,134 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.db import close_old_connections
+
+from django_walletpass import stats
+from django_walletpass.models import Log
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+logger = logging.getLogger('walletpass.services')
+
+# Queued by stop() to wake up the writer thread
+_WAKE_UP = object()
+
+
+class BufferedLogWriter:
+    """Process wide buffer of device logs written by a background thread.
+
+    Logs are queued (up to LOG_BUFFER_SIZE) and inserted with bulk_create every
+    LOG_BUFFER_BATCH_SIZE logs or LOG_BUFFER_FLUSH_INTERVAL seconds. When the
+    buffer is full, put() drops the logs (counted in the "logs_dropped" stats
+    counter) or blocks until there is room, see LOG_BUFFER_FULL. Buffered logs
+    are written at exit.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start the writer thread, if not started yet"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._queue = queue.Queue(maxsize=WALLETPASS_CONF['LOG_BUFFER_SIZE'])
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='walletpass-log-writer', daemon=True)
+            self._thread.start()
+
+    def put(self, logs):
+        """Queue unsaved Log instances (see Log.from_message)
+
+        Args:
+            logs (list): Log instances
+
+        Returns:
+            int: number of dropped logs
+        """
+        self.start()
+        dropped = 0
+        block = WALLETPASS_CONF['LOG_BUFFER_FULL'] == 'block'
+        for log in logs:
+            try:
+                self._queue.put(log, block=block)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            stats.incr('logs_dropped', dropped)
+        return dropped
+
+    def flush(self):
+        """Write every buffered log from the calling thread"""
+        while self._queue is not None:
+            batch = self._get_batch(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self):
+        """Stop the writer thread once the buffer is written"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        try:
+            self._queue.put_nowait(_WAKE_UP)
+        except queue.Full:
+            # the thread is busy writing, it won't wait
+            pass
+        thread.join()
+        self.flush()
+
+    def reset(self):
+        """Forget the thread and buffered logs, e.g. in a forked child"""
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+
+    def _run(self):
+        while True:
+            stopping = self._stopping.is_set()
+            batch = self._get_batch(block=not stopping)
+            if batch:
+                self._write(batch)
+            elif stopping:
+                return
+
+    def _get_batch(self, block):
+        batch_size = WALLETPASS_CONF['LOG_BUFFER_BATCH_SIZE']
+        deadline = time.monotonic() + WALLETPASS_CONF['LOG_BUFFER_FLUSH_INTERVAL']
+        batch = []
+        while len(batch) < batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    log = self._queue.get(timeout=timeout)
+                else:
+                    log = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if log is _WAKE_UP:
+                break
+            batch.append(log)
+        return batch
+
+    def _write(self, batch):
+        close_old_connections()
+        try:
+            Log.resolve_passes(batch)
+            Log.objects.bulk_create(batch)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("django_walletpass failed to write %s device logs", len(batch))
+
+
+log_writer = BufferedLogWriter()
+atexit.register(log_writer.stop)
+os.register_at_fork(after_in_child=log_writer.reset)
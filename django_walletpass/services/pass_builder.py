@@ -3,20 +3,22 @@ import json
 import os
 import secrets
 import tempfile
+import time
 import uuid
-import zipfile
 from glob import glob
 
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
 from django_walletpass import crypto
+from django_walletpass.services import archive
+from django_walletpass.services.template_cache import template_cache
 from django_walletpass.files import WalletpassContentFile
 from django_walletpass.models import Pass
 from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
 
 
-class PassBuilder:
+class PassBuilder:  # pylint: disable=too-many-instance-attributes
     def __init__(self, directory=None):
         self.pass_data = {}
         self.pass_data_required = {
@@ -28,8 +30,12 @@ class PassBuilder:
         }
         self.directory = None
         self.extra_files = {}
+        # files of a stored pass reused as they are, see read_from_model()
+        self.archive_entries = {}
         self.manifest_dict = {}
         self.builded_pass_content = None
+        # SHA-1 of the manifest.json of the last build
+        self.digest = None
         self.directory = directory
 
         if directory is not None:
@@ -40,11 +46,11 @@ class PassBuilder:
             "authenticationToken": crypto.gen_random_token(),
         })
 
-    def _copy_dir_files(self, tmp_pass_dir):
-        """Copy files from provided base dir to temporal dir
+    def _iter_dir_files(self):
+        """Iterate over the files of the provided base dir
 
-        Args:
-            tmp_pass_dir (str): temporal dir path
+        Yields:
+            tuple: (relative file path, file content)
         """
         for absolute_filepath in glob(os.path.join(self.directory, '**'), recursive=True):
             filename = os.path.basename(absolute_filepath)
@@ -54,15 +60,23 @@ class PassBuilder:
             if not os.path.isfile(absolute_filepath):
                 continue
             with open(absolute_filepath, 'rb') as file:
-                filecontent = file.read()
-                # Add files to manifest
-                self.manifest_dict[relative_file_path] = hashlib.sha1(filecontent).hexdigest()
-                dest_abs_filepath = os.path.join(tmp_pass_dir, relative_file_path)
-                dest_abs_dirpath = os.path.dirname(dest_abs_filepath)
-                if not os.path.exists(dest_abs_dirpath):
-                    os.makedirs(dest_abs_dirpath)
-                with open(dest_abs_filepath, 'wb') as ffile:
-                    ffile.write(filecontent)
+                yield relative_file_path, file.read()
+
+    def _copy_dir_files(self, tmp_pass_dir):
+        """Copy files from provided base dir to temporal dir
+
+        Args:
+            tmp_pass_dir (str): temporal dir path
+        """
+        for relative_file_path, filecontent in self._iter_dir_files():
+            # Add files to manifest
+            self.manifest_dict[relative_file_path] = hashlib.sha1(filecontent).hexdigest()
+            dest_abs_filepath = os.path.join(tmp_pass_dir, relative_file_path)
+            dest_abs_dirpath = os.path.dirname(dest_abs_filepath)
+            if not os.path.exists(dest_abs_dirpath):
+                os.makedirs(dest_abs_dirpath)
+            with open(dest_abs_filepath, 'wb') as ffile:
+                ffile.write(filecontent)
 
     def _write_extra_files(self, tmp_pass_dir):
         """Write extra files contained in self.extra_files into tmp dir
@@ -70,7 +84,9 @@ class PassBuilder:
         Args:
             tmp_pass_dir (str): temporal dir path
         """
-        for relative_file_path, filecontent in self.extra_files.items():
+        files = {path: entry.content for path, entry in self.archive_entries.items()}
+        files.update(self.extra_files)
+        for relative_file_path, filecontent in files.items():
             # Add files to manifest
             self.manifest_dict[relative_file_path] = hashlib.sha1(filecontent).hexdigest()
             dest_abs_filepath = os.path.join(tmp_pass_dir, relative_file_path)
@@ -80,18 +96,39 @@ class PassBuilder:
             with open(dest_abs_filepath, 'wb') as ffile:
                 ffile.write(filecontent)
 
-    def _write_pass_json(self, tmp_pass_dir):
-        """Write content of self.pass_data to pass.json (in JSON format)
+    def _get_pass_json_bytes(self):
+        """Serialize self.pass_data and add pass.json to manifest
 
-        Args:
-            tmp_pass_dir (str): temporal dir path where pass.json will be saved
+        Returns:
+            bytes: content of pass.json
         """
         pass_json = json.dumps(self.pass_data)
         pass_json_bytes = bytes(pass_json, 'utf8')
         # Add pass.json to manifest
         self.manifest_dict['pass.json'] = hashlib.sha1(pass_json_bytes).hexdigest()
+        return pass_json_bytes
+
+    def _get_manifest_json_and_signature(self):
+        """Serialize self.manifest_dict and sign it
+
+        Returns:
+            tuple: (content of manifest.json, content of signature)
+        """
+        # sorted, so the digest doesn't depend on the order files were added
+        manifest_json = json.dumps(self.manifest_dict, sort_keys=True)
+        manifest_json_bytes = bytes(manifest_json, 'utf8')
+        self.digest = hashlib.sha1(manifest_json_bytes).hexdigest()
+        signature_content = crypto.get_signer().sign(manifest_json_bytes)
+        return manifest_json_bytes, signature_content
+
+    def _write_pass_json(self, tmp_pass_dir):
+        """Write content of self.pass_data to pass.json (in JSON format)
+
+        Args:
+            tmp_pass_dir (str): temporal dir path where pass.json will be saved
+        """
         with open(os.path.join(tmp_pass_dir, 'pass.json'), 'wb') as ffile:
-            ffile.write(pass_json_bytes)
+            ffile.write(self._get_pass_json_bytes())
 
     def _write_manifest_json_and_signature(self, tmp_pass_dir):
         """Write the content of self.manifest_dict into manifest.json
@@ -99,44 +136,84 @@ class PassBuilder:
         Args:
             tmp_pass_dir (str): temporal dir path
         """
-        manifest_json = json.dumps(self.manifest_dict)
-        manifest_json_bytes = bytes(manifest_json, 'utf8')
+        manifest_json_bytes, signature_content = self._get_manifest_json_and_signature()
         with open(os.path.join(tmp_pass_dir, 'manifest.json'), 'wb') as ffile:
             ffile.write(manifest_json_bytes)
-        signature_content = crypto.pkcs7_sign(
-            certcontent=WALLETPASS_CONF['CERT_CONTENT'],
-            keycontent=WALLETPASS_CONF['KEY_CONTENT'],
-            wwdr_certificate=WALLETPASS_CONF['WWDRCA_PEM_CONTENT'],
-            data=manifest_json_bytes,
-            key_password=WALLETPASS_CONF['KEY_PASSWORD'],
-        )
         with open(os.path.join(tmp_pass_dir, 'signature'), 'wb') as ffile:
             ffile.write(signature_content)
 
-    def _zip_all(self, directory):
-        zip_file_path = os.path.join(directory, '..', 'walletcard.pkpass')
-        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_pkpass:
-            for filepath in glob(os.path.join(directory, '**'), recursive=True):
-                relative_file_path = os.path.relpath(filepath, directory)
-                if relative_file_path != '.':
-                    zip_pkpass.write(filepath, arcname=relative_file_path)
-        with open(zip_file_path, 'rb') as ffile:
-            return ffile.read()
+    def _zip_all(self, directory, date_time):
+        files = {}
+        for filepath in glob(os.path.join(directory, '**'), recursive=True):
+            if not os.path.isfile(filepath):
+                continue
+            with open(filepath, 'rb') as ffile:
+                files[os.path.relpath(filepath, directory)] = ffile.read()
+        return archive.write_archive(files, date_time)
+
+    def _build_in_memory(self, date_time):
+        """Zip pass files without touching the filesystem. Files of
+        self.directory come from the template cache already hashed and deflated.
+
+        Args:
+            date_time (tuple): date_time of the archive members
+
+        Returns:
+            bytes: .pkpass content
+        """
+        files = {}
+        if self.directory:
+            template = template_cache.get(self.directory)
+            for relative_file_path, entry in template.entries.items():
+                self.manifest_dict[relative_file_path] = entry.sha1
+                files[relative_file_path] = entry
+        for relative_file_path, entry in self.archive_entries.items():
+            self.manifest_dict[relative_file_path] = entry.sha1
+            files[relative_file_path] = entry
+        for relative_file_path, filecontent in self.extra_files.items():
+            self.manifest_dict[relative_file_path] = hashlib.sha1(filecontent).hexdigest()
+            files[relative_file_path] = filecontent
+        self.pre_build_pass_data()
+        files['pass.json'] = self._get_pass_json_bytes()
+        files['manifest.json'], files['signature'] = self._get_manifest_json_and_signature()
+        return archive.write_archive(files, date_time)
+
+    def _build_in_tmp_dir(self, date_time):
+        """Copy pass files to a temporal dir and zip it
+
+        Args:
+            date_time (tuple): date_time of the archive members
+
+        Returns:
+            bytes: .pkpass content
+        """
+        with tempfile.TemporaryDirectory() as tmpdirname:
+            os.mkdir(os.path.join(tmpdirname, 'data.pass'))
+            tmp_pass_dir = os.path.join(tmpdirname, 'data.pass')
+            if self.directory:
+                self._copy_dir_files(tmp_pass_dir)
+            self._write_extra_files(tmp_pass_dir)
+            self.pre_build_pass_data()
+            self._write_pass_json(tmp_pass_dir)
+            self._write_manifest_json_and_signature(tmp_pass_dir)
+            return self._zip_all(tmp_pass_dir, date_time)
 
     def _load_pass_json_file_if_exists(self, directory):
-        """Call self.load_pass_json_file if pass.json exist
+        """Load pass.json of the (cached) template directory if it exists
 
         Args:
             directory (str): directory where pass.json resides
         """
-        if os.path.isfile(os.path.join(directory, 'pass.json')):
-            self.load_pass_json_file(directory)
+        entry = template_cache.get(directory).entries.get('pass.json')
+        if entry is not None:
+            self.pass_data = json.loads(entry.content)
 
     def _clean_manifest(self):
         self.manifest_dict = {}
 
     def _clean_builded_pass_content(self):
         self.builded_pass_content = None
+        self.digest = None
 
     def validate(self):
         """Some validations before build the .pkpass file
@@ -167,53 +244,45 @@ class PassBuilder:
         """
         self.pass_data.update(self.pass_data_required)
 
-    def build(self):
+    def build(self, in_memory=True):
         """Build .pkpass file
+
+        Args:
+            in_memory (bool, optional): hash and zip the files from memory. If
+                False, files are written to a temporal dir before being zipped.
+                Both modes produce the same archive. Defaults to True.
+
+        Returns:
+            bytes: .pkpass content
         """
         self.clean()
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            os.mkdir(os.path.join(tmpdirname, 'data.pass'))
-            tmp_pass_dir = os.path.join(tmpdirname, 'data.pass')
-            if self.directory:
-                self._copy_dir_files(tmp_pass_dir)
-            self._write_extra_files(tmp_pass_dir)
-            self.pre_build_pass_data()
-            self._write_pass_json(tmp_pass_dir)
-            self._write_manifest_json_and_signature(tmp_pass_dir)
-            self.builded_pass_content = self._zip_all(tmp_pass_dir)
+        date_time = time.localtime()[:6]
+        if in_memory:
+            self.builded_pass_content = self._build_in_memory(date_time)
+        else:
+            self.builded_pass_content = self._build_in_tmp_dir(date_time)
         return self.builded_pass_content
 
     @classmethod
-    def read_from_model(cls, instance):
+    def read_from_model(cls, instance, incremental=False):
         """Create a new PassBuilder instances and reads into it the content of a
         Pass model.
+
+        Args:
+            instance (Pass): Pass instance to read
+            incremental (bool, optional): keep the stored files (all but
+                pass.json, manifest.json and signature) in self.archive_entries
+                instead of self.extra_files. They are zipped again with their
+                stored deflated stream and manifest hash, so a build only
+                serializes pass.json and signs the new manifest. Files added
+                with add_file() replace them. Defaults to False.
+
+        The builder keeps these stored files in archive_entries and the digest
+        of the rebuilt manifest in digest, so write_to_model() can tell an
+        identical rebuild from a change.
         """
-        builder = cls()
-        with tempfile.TemporaryDirectory() as tmpdirname:
-            os.mkdir(os.path.join(tmpdirname, 'data.pass'))
-            tmp_pass_dir = os.path.join(tmpdirname, 'data.pass')
-            # Put zip file into tmp dir
-            zip_path = os.path.join(tmpdirname, 'walletcard.pkpass')
-            with open(zip_path, 'wb') as ffile:
-                instance.data.seek(0)
-                ffile.write(instance.data.read())
-
-            # Extract zip file to tmp dir
-            with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                zip_ref.extractall(tmp_pass_dir)
-            # Populate builder with zip content
-            for filepath in glob(os.path.join(tmp_pass_dir, '**'), recursive=True):
-                filename = os.path.basename(filepath)
-                relative_file_path = os.path.relpath(filepath, tmp_pass_dir)
-                if filename == 'pass.json':
-                    builder.load_pass_json_file(tmp_pass_dir)
-                    continue
-                if relative_file_path in ['signature', 'manifest.json', '.', '..']:
-                    continue
-                if not os.path.isfile(filepath):
-                    continue
-                with open(filepath, 'rb') as ffile:
-                    builder.add_file(relative_file_path, ffile.read())
+        instance.data.seek(0)
+        builder = cls.read_from_archive(instance.data.read(), incremental=incremental)
         # Load of these fields due to that those fields are ignored
         # on pass.json loading
         builder.pass_data_required.update({
@@ -223,9 +292,38 @@ class PassBuilder:
         })
         return builder
 
+    @classmethod
+    def read_from_archive(cls, content, incremental=False):
+        """Create a new PassBuilder instance and read into it the files of a
+        .pkpass. pass_data_required isn't read, see read_from_model().
+
+        Args:
+            content (bytes): .pkpass content
+            incremental (bool, optional): see read_from_model(). Defaults to False.
+        """
+        builder = cls()
+        entries = archive.read_entries(content)
+        entries.pop('signature', None)
+        manifest = entries.pop('manifest.json', None)
+        manifest_dict = json.loads(manifest.content) if manifest is not None else {}
+        pass_json = entries.pop('pass.json', None)
+        if pass_json is not None:
+            builder.pass_data = json.loads(pass_json.content)
+        for relative_file_path, entry in entries.items():
+            if incremental:
+                entry.sha1 = manifest_dict.get(relative_file_path)
+                builder.archive_entries[relative_file_path] = entry
+            else:
+                builder.add_file(relative_file_path, entry.content)
+        return builder
+
     def write_to_model(self, instance=None):
         """Saves the content of builded and zipped pass into Pass model.
 
+        If instance already stores a pass with the same manifest.json (same
+        digest) storage isn't touched and the next instance.save() is skipped,
+        so updated_at isn't bumped and no push notification is sent.
+
         Args:
             instance (Pass, optional): Pass instance, a new one will be created
                 if none provided. Defaults to None.
@@ -240,6 +338,10 @@ class PassBuilder:
         setattr(instance, 'serial_number', self.pass_data_required.get('serialNumber'))
         setattr(instance, 'authentication_token', self.pass_data_required.get('authenticationToken'))
 
+        if instance.pk and instance.data.name and instance.digest == self.digest:
+            instance.mark_unchanged()
+            return instance
+
         if instance.data.name:
             filename = os.path.basename(instance.data.name)
         else:
@@ -248,7 +350,8 @@ class PassBuilder:
         if self.builded_pass_content is None:
             raise ValueError(_("Cannot save to model: builded_pass_content is None."))
         content = WalletpassContentFile(self.builded_pass_content)
-        instance.data.delete()
+        instance.digest = self.digest
+        instance.data.delete(save=False)
         instance.data.save(filename, content)
 
         return instance
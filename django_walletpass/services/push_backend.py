@@ -1,17 +1,72 @@
 import asyncio
 import logging
+import os
+import random
+import threading
+import time
+from collections import namedtuple
 from ssl import SSLError
 
 from aioapns import APNs, NotificationRequest
+from aioapns.common import APNS_RESPONSE_CODE
 from aioapns.exceptions import ConnectionClosed
 from asgiref.sync import sync_to_async
+from django.test.signals import setting_changed
 
 from django_walletpass.models import Registration
+from django_walletpass.services.rate_limit import rate_limiters
 from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
 from django_walletpass.signals import TOKEN_UNREGISTERED
 
 logger = logging.getLogger('walletpass.services')
 
+RETRY_STATUSES = (
+    APNS_RESPONSE_CODE.TOO_MANY_REQUESTS,
+    APNS_RESPONSE_CODE.INTERNAL_SERVER_ERROR,
+    APNS_RESPONSE_CODE.SERVICE_UNAVAILABLE,
+)
+
+
+class PushResult(namedtuple('PushResult', ['token', 'outcome', 'status', 'description', 'attempts'])):
+    """Result of a push to a device token. status and description are the
+    ones of the last APNs response (status is None if the request raised, and
+    description the error).
+    """
+    __slots__ = ()
+
+    SUCCESS = 'success'
+    # 429, 5xx or connection error, still failing after PUSH_RETRIES retries
+    RETRY_LATER = 'retry_later'
+    GONE = 'gone'
+    FATAL = 'fatal'
+
+    @property
+    def is_successful(self):
+        return self.outcome == self.SUCCESS
+
+
+def get_outcome(status):
+    """PushResult outcome of an APNs response status"""
+    if status == APNS_RESPONSE_CODE.SUCCESS:
+        return PushResult.SUCCESS
+    if status == APNS_RESPONSE_CODE.GONE:
+        return PushResult.GONE
+    if status in RETRY_STATUSES:
+        return PushResult.RETRY_LATER
+    return PushResult.FATAL
+
+
+def get_retry_delay(attempt):
+    """Seconds to wait before retry number attempt: exponential backoff from
+    PUSH_RETRY_DELAY, up to PUSH_RETRY_MAX_DELAY, with random jitter so
+    failed pushes are not retried all at once
+    """
+    delay = min(
+        WALLETPASS_CONF['PUSH_RETRY_DELAY'] * 2 ** (attempt - 1),
+        WALLETPASS_CONF['PUSH_RETRY_MAX_DELAY'],
+    )
+    return delay / 2 + random.uniform(0, delay / 2)
+
 
 @sync_to_async
 def send_notification_result_signal(notification_request, notification_result):
@@ -22,6 +77,90 @@ def send_notification_result_signal(notification_request, notification_result):
     )
 
 
+class APNsClientPool:
+    """Long-lived APNs clients shared by every PushBackend of the process.
+
+    aioapns clients keep their HTTP/2 connections (up to PUSH_MAX_CONNECTIONS)
+    open and reuse them, but they are bound to the event loop they were created
+    on. Clients are kept per key (see PushBackend.get_client) and closed when
+    unused for PUSH_CLIENT_IDLE_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """Return the client of key, creating it with factory() if needed
+
+        Args:
+            key (tuple): client key, the first item must be its event loop
+            factory (callable): builds a new client
+        """
+        now = time.monotonic()
+        self.reap(now=now)
+        with self._lock:
+            client, _last_used = self._clients.get(key, (None, None))
+            if client is None:
+                client = factory()
+            self._clients[key] = (client, now)
+        return client
+
+    def reap(self, idle_timeout=None, now=None):
+        """Close clients unused for more than idle_timeout seconds
+
+        Args:
+            idle_timeout (float, optional): defaults to PUSH_CLIENT_IDLE_TIMEOUT
+            now (float, optional): time.monotonic() value. Defaults to None.
+        """
+        if idle_timeout is None:
+            idle_timeout = WALLETPASS_CONF['PUSH_CLIENT_IDLE_TIMEOUT']
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle_keys = [
+                key for key, (_client, last_used) in self._clients.items()
+                if now - last_used > idle_timeout
+            ]
+            idle_clients = [(key[0], self._clients.pop(key)[0]) for key in idle_keys]
+        for loop, client in idle_clients:
+            self._close_client(loop, client)
+
+    def close(self):
+        """Close the connections of every client and forget them"""
+        with self._lock:
+            clients = [(key[0], client) for key, (client, _last_used) in self._clients.items()]
+            self._clients = {}
+        for loop, client in clients:
+            self._close_client(loop, client)
+
+    def clear(self):
+        """Forget every client without closing its connections, e.g. in a
+        forked child process which must not share its parent's connections
+        """
+        with self._lock:
+            self._clients = {}
+
+    def __len__(self):
+        return len(self._clients)
+
+    @staticmethod
+    def _close_client(loop, client):
+        if not loop.is_closed():
+            client.pool.close()
+
+
+apns_clients = APNsClientPool()
+os.register_at_fork(after_in_child=apns_clients.clear)
+
+
+def close_apns_clients(*args, **kwargs):  # pylint: disable=unused-argument
+    if kwargs['setting'] == 'WALLETPASS':
+        apns_clients.close()
+
+
+setting_changed.connect(close_apns_clients)
+
+
 class PushBackend:
     def __init__(self):
         try:
@@ -30,35 +169,133 @@ class PushBackend:
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
 
-    async def push_notification(self, client, token):
-        try:
-            request = NotificationRequest(device_token=token, message={"aps": {}},)
-            response = await client.send_notification(request)
-            return response
-
-        except SSLError as e:
-            logger.error("django_walletpass SSLError: %s", e)
-        except (ConnectionError, ConnectionClosed) as e:
-            logger.error("django_walletpass StreamResetError. Bad cert or token? %s", e)
-        # Errors should never pass silently.
-        except Exception as e:  # pylint: disable=broad-except
-            # Unless explicitly silenced.
-            logger.error("django_walletpass uncaught error %s", e)
-
-    def push_notification_with_token(self, token):
-        client = APNs(
+    def create_client(self, topic):
+        """Create a new APNs client for topic. Override to customize the client.
+
+        Args:
+            topic (str): apns-topic (pass type identifier)
+        """
+        return APNs(
             key=WALLETPASS_CONF["TOKEN_AUTH_KEY_PATH"],
             key_id=WALLETPASS_CONF["TOKEN_AUTH_KEY_ID"],
             team_id=WALLETPASS_CONF["TEAM_ID"],
-            topic=WALLETPASS_CONF["PASS_TYPE_ID"],
+            topic=topic,
+            max_connections=WALLETPASS_CONF["PUSH_MAX_CONNECTIONS"],
             use_sandbox=WALLETPASS_CONF["PUSH_SANDBOX"],
             err_func=send_notification_result_signal,
         )
-        return self.loop.run_until_complete(self.push_notification(client, token))
+
+    def get_client(self, topic=None, loop=None):
+        """Return the pooled APNs client of (loop, topic, sandbox, auth strategy)
+
+        Args:
+            topic (str, optional): apns-topic, defaults to PASS_TYPE_ID
+            loop (asyncio.AbstractEventLoop, optional): loop the client will
+                run on. Defaults to self.loop.
+        """
+        topic = topic or WALLETPASS_CONF["PASS_TYPE_ID"]
+        key = (
+            loop or self.loop,
+            topic,
+            WALLETPASS_CONF["PUSH_SANDBOX"],
+            WALLETPASS_CONF["PUSH_AUTH_STRATEGY"],
+            type(self),
+        )
+        return apns_clients.get(key, lambda: self.create_client(topic))
+
+    async def send_notification(self, client, token):
+        """Send one push request, errors are raised"""
+        request = NotificationRequest(device_token=token, message={"aps": {}},)
+        return await client.send_notification(request)
+
+    async def push_notification(self, client, token, topic=None):
+        """Push to token. Waits for the rate limiter of topic (see
+        PUSH_RATE_LIMIT) and retries 429, 5xx and connection errors up to
+        PUSH_RETRIES times with exponential backoff (see get_retry_delay).
+
+        Args:
+            client (APNs): client of topic, see get_client()
+            token (str): device push token
+            topic (str, optional): apns-topic, defaults to PASS_TYPE_ID
+
+        Returns:
+            PushResult: result of the last attempt
+        """
+        rate_limiter = rate_limiters.get(topic or WALLETPASS_CONF["PASS_TYPE_ID"])
+        attempts = 0
+        while True:
+            if rate_limiter is not None:
+                await rate_limiter.acquire()
+            attempts += 1
+            status = None
+            try:
+                response = await self.send_notification(client, token)
+            except SSLError as e:
+                logger.error("django_walletpass SSLError: %s", e)
+                return PushResult(token, PushResult.FATAL, None, str(e), attempts)
+            except (ConnectionError, ConnectionClosed, asyncio.TimeoutError) as e:
+                logger.warning("django_walletpass connection error. Bad cert or token? %s", e)
+                outcome, description = PushResult.RETRY_LATER, str(e) or type(e).__name__
+            # Errors should never pass silently.
+            except Exception as e:  # pylint: disable=broad-except
+                # Unless explicitly silenced.
+                logger.error("django_walletpass uncaught error %s", e)
+                return PushResult(token, PushResult.FATAL, None, str(e), attempts)
+            else:
+                status, description = response.status, response.description
+                outcome = get_outcome(status)
+
+            if outcome != PushResult.RETRY_LATER or attempts > WALLETPASS_CONF["PUSH_RETRIES"]:
+                return PushResult(token, outcome, status, description, attempts)
+            await asyncio.sleep(get_retry_delay(attempts))
+
+    async def push_notifications(self, client, tokens, topic=None):
+        """Push to every token concurrently. At most PUSH_CONCURRENCY pushes
+        (including the ones waiting to be retried) are in flight, and only as
+        many tasks are created whatever the number of tokens.
+
+        Returns:
+            list: PushResult, in the order of tokens
+        """
+        results = [None] * len(tokens)
+        pending = iter(enumerate(tokens))
+
+        async def push():
+            for index, token in pending:
+                results[index] = await self.push_notification(client, token, topic=topic)
+
+        workers = min(WALLETPASS_CONF["PUSH_CONCURRENCY"], len(tokens))
+        await asyncio.gather(*(push() for _ in range(workers)))
+        return results
+
+    def push_notification_with_token(self, token, topic=None):
+        client = self.get_client(topic=topic)
+        return self.loop.run_until_complete(self.push_notification(client, token, topic=topic))
+
+    def push_notification_with_tokens(self, tokens, topic=None):
+        client = self.get_client(topic=topic)
+        return self.loop.run_until_complete(self.push_notifications(client, tokens, topic=topic))
 
     def push_notification_from_instance(self, registration_instance):
         return self.push_notification_with_token(registration_instance.push_token)
 
+    def push_notification_from_instances(self, registration_instances):
+        return self.push_notification_with_tokens(
+            [registration.push_token for registration in registration_instances]
+        )
+
+    async def apush_notification_with_tokens(self, tokens, topic=None):
+        """Async version of push_notification_with_tokens(), for callers
+        already running in an event loop (e.g. ASGI views)
+        """
+        client = self.get_client(topic=topic, loop=asyncio.get_running_loop())
+        return await self.push_notifications(client, tokens, topic=topic)
+
+    async def apush_notification_from_instances(self, registration_instances):
+        return await self.apush_notification_with_tokens(
+            [registration.push_token for registration in registration_instances]
+        )
+
     def push_notification_from_pk(self, registration_pk):
         registration = Registration.objects.get(pk=registration_pk)
         return self.push_notification_from_instance(registration)
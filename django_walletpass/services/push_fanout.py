@@ -0,0 +1,93 @@
+import itertools
+from collections import defaultdict
+
+from aioapns.common import APNS_RESPONSE_CODE
+from django.utils.module_loading import import_string
+
+from django_walletpass.models import Pass, Registration
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+from django_walletpass.signals import collect_gone_tokens
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def get_push_tokens(passes):
+    """Distinct push tokens of the registrations of passes, with one query.
+
+    Args:
+        passes (QuerySet): passes, or any iterable of Pass instances or pks
+
+    Returns:
+        dict: topic (pass type identifier) -> list of push tokens
+    """
+    pairs = Registration.objects.filter(pazz__in=passes).values_list(
+        'pazz__pass_type_identifier',
+        'push_token',
+    ).order_by().distinct()
+    tokens = defaultdict(list)
+    for topic, push_token in pairs.iterator():
+        tokens[topic].append(push_token)
+    return dict(tokens)
+
+
+def push_passes(passes, batch_size=DEFAULT_BATCH_SIZE):
+    """Push once to every device registered for any of passes.
+
+    A device uses the same push token for all its passes of a pass type, and
+    one push makes it check all of them, so each distinct (topic, push token)
+    is pushed once with WALLETPASS_PUSH_CLASS instead of once per registration.
+    Tokens reported 410 GONE are unregistered in one batch at the end.
+
+    Args:
+        passes (QuerySet): passes, or any iterable of Pass instances or pks
+        batch_size (int, optional): tokens pushed per push_notification_with_tokens()
+            call. Defaults to DEFAULT_BATCH_SIZE.
+
+    Returns:
+        int: number of pushes sent
+    """
+    return push_tokens(get_push_tokens(passes), batch_size=batch_size)
+
+
+def push_tokens(tokens, batch_size=DEFAULT_BATCH_SIZE):
+    """Push once to every token of tokens, see push_passes(). Push classes
+    without push_notification_with_tokens() get unsaved Registration
+    instances, with only push_token set, and their default topic.
+
+    Args:
+        tokens (dict): topic -> push tokens, e.g. from get_push_tokens()
+        batch_size (int, optional): tokens pushed per push_notification_with_tokens()
+            call. Defaults to DEFAULT_BATCH_SIZE.
+
+    Returns:
+        int: number of pushes sent
+    """
+    klass = import_string(WALLETPASS_CONF['WALLETPASS_PUSH_CLASS'])
+    push_module = klass()
+    pushed = 0
+    with collect_gone_tokens() as gone_tokens:
+        for topic, topic_tokens in tokens.items():
+            iterator = iter(topic_tokens)
+            while True:
+                batch = list(itertools.islice(iterator, batch_size))
+                if not batch:
+                    break
+                responses = _push_batch(push_module, batch, topic or None)
+                gone_tokens.update(
+                    push_token
+                    for push_token, response in zip(batch, responses)
+                    if response is not None and response.status == APNS_RESPONSE_CODE.GONE
+                )
+                pushed += len(batch)
+    if gone_tokens:
+        Pass.unregister_tokens(gone_tokens)
+    return pushed
+
+
+def _push_batch(push_module, batch, topic):
+    if hasattr(push_module, 'push_notification_with_tokens'):
+        return push_module.push_notification_with_tokens(batch, topic=topic)
+    registrations = [Registration(push_token=push_token) for push_token in batch]
+    if hasattr(push_module, 'push_notification_from_instances'):
+        return push_module.push_notification_from_instances(registrations)
+    return [push_module.push_notification_from_instance(registration) for registration in registrations]
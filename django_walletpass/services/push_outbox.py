@@ -0,0 +1,76 @@
+import datetime
+import logging
+
+from django.utils import timezone
+
+from django_walletpass.models import Pass, PushOutbox, Registration
+from django_walletpass.services.push_backend import RETRY_STATUSES, PushResult
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+logger = logging.getLogger('walletpass.services')
+
+MAX_RETRY_DELAY = 3600
+
+
+def get_retry_delay(attempts):
+    """Seconds to wait before the next attempt (exponential backoff)"""
+    return min(WALLETPASS_CONF['PUSH_OUTBOX_RETRY_DELAY'] * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def process_outbox(batch_size=None):
+    """Claim a batch of due PushOutbox entries and push their passes. All the
+    registrations of the batch are pushed concurrently, once per pass even if
+    it was enqueued several times. Entries whose push must be retried later
+    (PushResult.RETRY_LATER: 429, 5xx or connection error) are retried with
+    exponential backoff up to PUSH_OUTBOX_MAX_ATTEMPTS.
+
+    Args:
+        batch_size (int, optional): defaults to PUSH_OUTBOX_BATCH_SIZE
+
+    Returns:
+        int: number of claimed entries, 0 if there was nothing to push
+    """
+    entries = PushOutbox.claim(
+        batch_size or WALLETPASS_CONF['PUSH_OUTBOX_BATCH_SIZE'],
+        lease=WALLETPASS_CONF['PUSH_OUTBOX_LEASE'],
+    )
+    if not entries:
+        return 0
+
+    registrations = list(Registration.objects.filter(pazz_id__in={entry.pazz_id for entry in entries}))
+    errors = {}
+    if registrations:
+        responses = Pass.push_registrations(registrations)
+        for registration, response in zip(registrations, responses):
+            if response is None:
+                errors[registration.pazz_id] = "push error"
+            elif getattr(response, 'outcome', None) == PushResult.RETRY_LATER or response.status in RETRY_STATUSES:
+                # no status when the push raised a connection error
+                errors[registration.pazz_id] = (
+                    f"{response.status} {response.description}" if response.status else str(response.description)
+                )
+
+    now = timezone.now()
+    done, retry = [], []
+    for entry in entries:
+        if entry.pazz_id not in errors:
+            done.append(entry.pk)
+            continue
+        entry.attempts += 1
+        entry.last_error = errors[entry.pazz_id]
+        if entry.attempts >= WALLETPASS_CONF['PUSH_OUTBOX_MAX_ATTEMPTS']:
+            logger.error(
+                "django_walletpass giving up push of pass %s after %s attempts: %s",
+                entry.pazz_id, entry.attempts, entry.last_error,
+            )
+            done.append(entry.pk)
+            continue
+        entry.claimed_at = None
+        entry.next_attempt_at = now + datetime.timedelta(seconds=get_retry_delay(entry.attempts))
+        retry.append(entry)
+
+    if done:
+        PushOutbox.objects.filter(pk__in=done).delete()
+    if retry:
+        PushOutbox.objects.bulk_update(retry, ['attempts', 'last_error', 'claimed_at', 'next_attempt_at'])
+    return len(entries)
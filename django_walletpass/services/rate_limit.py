@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+import time
+
+from django.test.signals import setting_changed
+
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class TokenBucket:
+    """Token bucket limiter: rate acquisitions per second on average, in
+    bursts of up to capacity. It can be shared by several threads and event
+    loops.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = max(capacity or rate, 1)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, now=None):
+        """Take a token if there is one available
+
+        Args:
+            now (float, optional): time.monotonic() value. Defaults to None.
+
+        Returns:
+            float: 0 if a token was taken, else seconds until the next one
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        """Wait until a token is taken"""
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class RateLimiters:
+    """Process wide TokenBucket per APNs topic, allowing PUSH_RATE_LIMIT
+    pushes per second in bursts of up to PUSH_RATE_BURST (defaults to
+    PUSH_RATE_LIMIT).
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def get(self, topic):
+        """Return the TokenBucket of topic, None if PUSH_RATE_LIMIT is not set
+
+        Args:
+            topic (str): apns-topic (pass type identifier)
+        """
+        rate = WALLETPASS_CONF['PUSH_RATE_LIMIT']
+        if not rate:
+            return None
+        with self._lock:
+            bucket = self._buckets.get(topic)
+            if bucket is None:
+                bucket = TokenBucket(rate, WALLETPASS_CONF['PUSH_RATE_BURST'])
+                self._buckets[topic] = bucket
+        return bucket
+
+    def clear(self):
+        with self._lock:
+            self._buckets = {}
+
+
+rate_limiters = RateLimiters()
+os.register_at_fork(after_in_child=rate_limiters.clear)
+
+
+def clear_rate_limiters(*args, **kwargs):  # pylint: disable=unused-argument
+    if kwargs['setting'] == 'WALLETPASS':
+        rate_limiters.clear()
+
+
+setting_changed.connect(clear_rate_limiters)
@@ -0,0 +1,107 @@
+import os
+import threading
+from collections import OrderedDict
+from glob import glob
+
+from django_walletpass.services.archive import ArchiveEntry
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class PassTemplate:
+    """Files of a pass template directory, already hashed and deflated
+    """
+    __slots__ = ('directory', 'fingerprint', 'entries')
+
+    def __init__(self, directory, fingerprint, entries):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        # relative file path -> ArchiveEntry, in directory walk order
+        self.entries = entries
+
+    @classmethod
+    def load(cls, directory, fingerprint):
+        entries = {}
+        for relative_file_path, _stat in fingerprint:
+            with open(os.path.join(directory, relative_file_path), 'rb') as ffile:
+                entries[relative_file_path] = ArchiveEntry.from_content(ffile.read())
+        return cls(directory, fingerprint, entries)
+
+
+def get_fingerprint(directory):
+    """Relative path, size and mtime of every file in directory.
+
+    Args:
+        directory (str): pass template directory
+
+    Returns:
+        tuple: ((relative file path, (size, mtime_ns)), ...)
+    """
+    fingerprint = []
+    for absolute_filepath in glob(os.path.join(directory, '**'), recursive=True):
+        if os.path.basename(absolute_filepath) == '.DS_Store':
+            continue
+        if not os.path.isfile(absolute_filepath):
+            continue
+        stat = os.stat(absolute_filepath)
+        fingerprint.append((
+            os.path.relpath(absolute_filepath, directory),
+            (stat.st_size, stat.st_mtime_ns),
+        ))
+    return tuple(fingerprint)
+
+
+class TemplateCache:
+    """Process wide LRU cache of pass templates keyed by directory.
+
+    A cached template is reused while the size and mtime of its files do not
+    change. Up to WALLETPASS_CONF['TEMPLATE_CACHE_SIZE'] templates are kept,
+    0 disables the cache.
+    """
+
+    def __init__(self):
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, directory):
+        """Return the PassTemplate of directory, loading it if needed
+
+        Args:
+            directory (str): pass template directory
+        """
+        directory = os.path.abspath(directory)
+        fingerprint = get_fingerprint(directory)
+        with self._lock:
+            template = self._templates.get(directory)
+            if template is not None and template.fingerprint == fingerprint:
+                self._templates.move_to_end(directory)
+                return template
+
+        template = PassTemplate.load(directory, fingerprint)
+        max_size = WALLETPASS_CONF['TEMPLATE_CACHE_SIZE']
+        with self._lock:
+            self._templates[directory] = template
+            self._templates.move_to_end(directory)
+            while len(self._templates) > max_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def invalidate(self, directory=None):
+        """Drop a cached template, or every template if directory is None
+
+        Args:
+            directory (str, optional): pass template directory. Defaults to None.
+        """
+        with self._lock:
+            if directory is None:
+                self._templates.clear()
+            else:
+                self._templates.pop(os.path.abspath(directory), None)
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, directory):
+        return os.path.abspath(directory) in self._templates
+
+
+template_cache = TemplateCache()
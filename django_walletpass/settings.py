@@ -36,10 +36,36 @@ DEFAULTS = {
     'SERVICE_URL': None,
     'WALLETPASS_PUSH_CLASS': 'django_walletpass.services.PushBackend',
     'PUSH_SANDBOX': False,
+    'PUSH_MAX_CONNECTIONS': 10,
+    'PUSH_CLIENT_IDLE_TIMEOUT': 300,
+    'PUSH_CONCURRENCY': 100,
+    'PUSH_RETRIES': 2,
+    'PUSH_RETRY_DELAY': 0.5,
+    'PUSH_RETRY_MAX_DELAY': 10,
+    'PUSH_RATE_LIMIT': None,  # pushes per second and topic
+    'PUSH_RATE_BURST': None,
+    'PUSH_OUTBOX': False,
+    'PUSH_OUTBOX_BATCH_SIZE': 100,
+    'PUSH_OUTBOX_LEASE': 300,
+    'PUSH_OUTBOX_MAX_ATTEMPTS': 10,
+    'PUSH_OUTBOX_RETRY_DELAY': 5,
+    'PUSH_DEBOUNCE_SECONDS': 0,
     'STORAGE_BACKEND': None,  # DJ4.2+ only
     'STORAGE_CLASS': STORAGE_CLASS,
     'STORAGE_HTTP_REDIRECT': False,
+    'STORAGE_SENDFILE': None,  # None, x-accel-redirect or x-sendfile
+    'STORAGE_SENDFILE_PREFIX': '/walletpass-internal/',
     'UPLOAD_TO': 'passes',
+    'TEMPLATE_CACHE_SIZE': 16,
+    'STATS_CACHE': 'default',
+    'PASS_CACHE': None,
+    'PASS_CACHE_TIMEOUT': 300,
+    'LOG_BUFFER': False,
+    'LOG_BUFFER_SIZE': 10000,
+    'LOG_BUFFER_BATCH_SIZE': 500,
+    'LOG_BUFFER_FLUSH_INTERVAL': 1,
+    'LOG_BUFFER_FULL': 'drop',  # drop or block
+    'LOG_RETENTION_DAYS': 90,
 }
 
 
@@ -1,17 +1,40 @@
 from aioapns.common import APNS_RESPONSE_CODE
-from django.db.models.signals import post_save
-from django.dispatch import Signal, receiver
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from django_walletpass.models import Pass, Registration
+from django_walletpass import pass_cache
+from django_walletpass.dispatch import (
+    GONE_TOKENS,
+    PASS_REGISTERED,
+    PASS_UNREGISTERED,
+    TOKEN_UNREGISTERED,
+    asend,
+    collect_gone_tokens,
+)
+from django_walletpass.models import Pass, PushOutbox
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
 
-TOKEN_UNREGISTERED = Signal()
-PASS_REGISTERED = Signal()
-PASS_UNREGISTERED = Signal()
+__all__ = [
+  "PASS_REGISTERED",
+  "PASS_UNREGISTERED",
+  "TOKEN_UNREGISTERED",
+  "asend",
+  "collect_gone_tokens",
+]
 
 
 @receiver(post_save, sender=Pass)
 def send_push_notification(instance=None, **_kwargs):
-    instance.push_notification()
+    if WALLETPASS_CONF['PUSH_OUTBOX']:
+        PushOutbox.enqueue(instance, delay=WALLETPASS_CONF['PUSH_DEBOUNCE_SECONDS'])
+    else:
+        instance.push_notification()
+
+
+@receiver(post_save, sender=Pass)
+@receiver(post_delete, sender=Pass)
+def invalidate_pass_cache(instance=None, **_kwargs):
+    pass_cache.invalidate_on_commit(instance.pass_type_identifier, instance.serial_number)
 
 
 @receiver(TOKEN_UNREGISTERED)
@@ -22,9 +45,8 @@ def delete_registration(
     **kwargs  # pylint: disable=unused-argument
 ):
     if notification_result.status == APNS_RESPONSE_CODE.GONE:
-        registration = Registration.objects.get(
-            push_token=notification_request.device_token
-        )
-        pass_ = registration.pazz
-        registration.delete()
-        PASS_UNREGISTERED.send(sender=pass_)
+        gone_tokens = GONE_TOKENS.get()
+        if gone_tokens is not None:
+            gone_tokens.add(notification_request.device_token)
+        else:
+            Pass.unregister_tokens([notification_request.device_token])
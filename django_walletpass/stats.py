@@ -0,0 +1,36 @@
+from django.core.cache import caches
+
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+KEY_PREFIX = 'walletpass:stats:'
+
+
+def _get_cache():
+    return caches[WALLETPASS_CONF['STATS_CACHE']]
+
+
+def incr(name, delta=1):
+    """Increment a counter shared by every process using the STATS_CACHE
+    cache. Counters never expire.
+
+    Args:
+        name (str): counter name
+        delta (int, optional): Defaults to 1.
+    """
+    cache = _get_cache()
+    key = KEY_PREFIX + name
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # evicted between add() and incr()
+        cache.set(key, delta, timeout=None)
+
+
+def get(name):
+    """Current value of a counter, 0 if it was never incremented"""
+    return _get_cache().get(KEY_PREFIX + name, 0)
+
+
+def reset(name):
+    _get_cache().delete(KEY_PREFIX + name)
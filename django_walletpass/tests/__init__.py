@@ -1,2 +1,8 @@
 # pylint: disable=wildcard-import
+from django_walletpass.tests.asyncviews import *
+from django_walletpass.tests.builder import *
+from django_walletpass.tests.bulk import *
+from django_walletpass.tests.logs import *
 from django_walletpass.tests.main import *
+from django_walletpass.tests.push import *
+from django_walletpass.tests.views import *
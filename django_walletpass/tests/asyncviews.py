@@ -0,0 +1,86 @@
+import io
+import json
+import zipfile
+from unittest import mock, skipIf
+
+import django
+from aioapns.common import APNS_RESPONSE_CODE
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from django_walletpass.models import Log, Pass, Registration
+from django_walletpass.services import PassBuilder, PushBackend
+
+
+@skipIf(django.VERSION < (4, 2), "async views require Django 4.2+")
+@override_settings(ROOT_URLCONF='django_walletpass.asyncurls')
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        builder = PassBuilder()
+        builder.pass_data = {"formatVersion": 1}
+        builder.build()
+        with mock.patch.object(Pass, "push_notification"):
+            self.pass_instance = builder.write_to_model()
+            self.pass_instance.save()
+        self.pass_type_id = self.pass_instance.pass_type_identifier
+        self.serial_number = self.pass_instance.serial_number
+        self.device_library_id = 'ebc6fdbd52ffd906fc294aba259f239c'
+        self.auth = {'Authorization': f'ApplePass {self.pass_instance.authentication_token}'}
+
+    async def test_register_list_and_unregister(self):
+        url = reverse('walletpass_register_pass', args=[self.device_library_id, self.pass_type_id, self.serial_number])
+        with mock.patch("django_walletpass.asyncviews.PASS_REGISTERED") as registered_mock:
+            registered_mock.asend = mock.AsyncMock()
+            response = await self.async_client.post(
+                url, data=json.dumps({'pushToken': 'token'}), content_type='application/json', headers=self.auth,
+            )
+            self.assertEqual(response.status_code, 201)
+            registered_mock.asend.assert_awaited_once()
+            response = await self.async_client.post(
+                url, data=json.dumps({'pushToken': 'token'}), content_type='application/json', headers=self.auth,
+            )
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(await Registration.objects.acount(), 1)
+
+        response = await self.async_client.get(
+            reverse('walletpass_registrations', args=[self.device_library_id, self.pass_type_id]),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['serialNumbers'], [self.serial_number])
+
+        response = await self.async_client.delete(url, headers={'Authorization': 'ApplePass wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.delete(url, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await Registration.objects.acount(), 0)
+
+    async def test_latest_version(self):
+        url = reverse('walletpass_latest_version', args=[self.pass_type_id, self.serial_number])
+        response = await self.async_client.get(url, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=pass.pkpass')
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(zipfile.is_zipfile(io.BytesIO(content)))
+
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag'], **self.auth})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_log(self):
+        response = await self.async_client.post(
+            reverse('walletpass_log'), data=json.dumps({'logs': ["garbage"]}), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await Log.objects.filter(status="unknown").acount(), 1)
+
+    @mock.patch.object(PushBackend, "get_client")
+    async def test_apush_notification(self, _get_client_mock):
+        await Registration.objects.acreate(device_library_identifier="a", push_token="token0", pazz=self.pass_instance)
+        await Registration.objects.acreate(device_library_identifier="b", push_token="token1", pazz=self.pass_instance)
+
+        async def send_notification(_self, _client, token):
+            status_code = APNS_RESPONSE_CODE.GONE if token == "token1" else APNS_RESPONSE_CODE.SUCCESS
+            return mock.Mock(status=status_code)
+
+        with mock.patch.object(PushBackend, "send_notification", send_notification):
+            await self.pass_instance.apush_notification()
+        self.assertEqual([r async for r in Registration.objects.values_list("push_token", flat=True)], ["token0"])
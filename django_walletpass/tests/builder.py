@@ -0,0 +1,227 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from django_walletpass.services import PassBuilder, archive, template_cache
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class ArchiveTestCase(TestCase):
+    def test_write_archive_round_trip(self):
+        entries = archive.read_entries(archive.write_archive({"stored.txt": b"stored " * 100}, (2020, 1, 1, 0, 0, 0)))
+        files = {
+            "pass.json": b'{"formatVersion": 1}',
+            "en.lproj/pass.strings": "\"é\" = \"e\";".encode(),
+            "\u00e9.png": bytes(range(256)) * 10,
+            "empty": b"",
+            "stored.txt": entries["stored.txt"],
+        }
+        content = archive.write_archive(files, (2026, 1, 2, 3, 4, 6))
+        with zipfile.ZipFile(io.BytesIO(content)) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.namelist(), sorted(files))
+            for zinfo in zip_file.infolist():
+                self.assertEqual(zinfo.date_time, (2026, 1, 2, 3, 4, 6))
+                self.assertEqual(zinfo.compress_type, zipfile.ZIP_DEFLATED)
+                self.assertEqual(zinfo.external_attr, archive.FILE_MODE)
+            self.assertEqual(zip_file.read("stored.txt"), b"stored " * 100)
+            self.assertEqual(zip_file.read("\u00e9.png"), files["\u00e9.png"])
+        # deflated streams are written as they are
+        self.assertEqual(archive.read_entries(content)["stored.txt"].compressed, entries["stored.txt"].compressed)
+
+
+class IncrementalBuildTestCase(TestCase):
+    def setUp(self):
+        builder = PassBuilder(
+            directory=os.path.join(settings.BASE_DIR, 'base_passes', 'StoreCard.pass')
+        )
+        builder.pass_data.update({"description": "Loyalty card", "balance": 10})
+        builder.build()
+        self.instance = builder.write_to_model()
+        self.instance.save()
+        self.manifest_dict = builder.manifest_dict
+
+    def test_read_from_model_incremental(self):
+        builder = PassBuilder.read_from_model(self.instance, incremental=True)
+        self.assertEqual(builder.extra_files, {})
+        self.assertIn('logo.png', builder.archive_entries)
+        self.assertNotIn('pass.json', builder.archive_entries)
+        self.assertNotIn('manifest.json', builder.archive_entries)
+        self.assertNotIn('signature', builder.archive_entries)
+        # stored deflated streams and manifest hashes are reused
+        logo = builder.archive_entries['logo.png']
+        self.assertEqual(logo.sha1, self.manifest_dict['logo.png'])
+
+        builder.pass_data['balance'] = 20
+        content = builder.build()
+        self.assertEqual(builder.pass_data_required['serialNumber'], self.instance.serial_number)
+        for path, sha1 in self.manifest_dict.items():
+            if path != 'pass.json':
+                self.assertEqual(builder.manifest_dict[path], sha1)
+        self.assertNotEqual(builder.manifest_dict['pass.json'], self.manifest_dict['pass.json'])
+        entries = archive.read_entries(content)
+        self.assertEqual(entries['logo.png'].compressed, logo.compressed)
+        self.assertEqual(json.loads(entries['pass.json'].content)['balance'], 20)
+        self.assertEqual(json.loads(entries['manifest.json'].content), builder.manifest_dict)
+
+    @mock.patch("django_walletpass.services.pass_builder.time.localtime")
+    @mock.patch("django_walletpass.services.pass_builder.crypto.get_signer")
+    def test_incremental_same_as_full_build(self, get_signer_mock, localtime_mock):
+        get_signer_mock.return_value.sign.return_value = b"signature"
+        localtime_mock.return_value = time.struct_time((2026, 1, 2, 3, 4, 6, 0, 1, 0))
+        incremental = PassBuilder.read_from_model(self.instance, incremental=True)
+        full = PassBuilder.read_from_model(self.instance)
+        for builder in (incremental, full):
+            builder.pass_data['balance'] = 30
+            builder.add_file('strip.png', b'new strip')
+        self.assertEqual(incremental.build(), full.build())
+        self.assertEqual(incremental.build(in_memory=False), full.build())
+
+
+class UnchangedPassTestCase(TestCase):
+    def setUp(self):
+        builder = PassBuilder()
+        builder.pass_data = {"formatVersion": 1, "description": "Loyalty card", "balance": 10}
+        builder.build()
+        self.instance = builder.write_to_model()
+        self.instance.save()
+
+    def test_digest(self):
+        self.assertEqual(len(self.instance.digest), 40)
+        with zipfile.ZipFile(self.instance.data.path) as zip_pkpass:
+            manifest = zip_pkpass.read('manifest.json')
+        self.assertEqual(self.instance.digest, hashlib.sha1(manifest).hexdigest())
+
+    @mock.patch("django_walletpass.models.Pass.push_notification")
+    def test_unchanged_pass_is_not_saved(self, push_notification_mock):
+        data_name = self.instance.data.name
+        updated_at = self.instance.updated_at
+        builder = PassBuilder.read_from_model(self.instance, incremental=True)
+        builder.build()
+        with mock.patch.object(self.instance.data.storage, "save") as save_mock:
+            builder.write_to_model(self.instance)
+            with self.assertNumQueries(0):
+                self.instance.save()
+        save_mock.assert_not_called()
+        push_notification_mock.assert_not_called()
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.updated_at, updated_at)
+        self.assertEqual(self.instance.data.name, data_name)
+
+    @mock.patch("django_walletpass.models.Pass.push_notification")
+    def test_unchanged_directory_pass_is_not_saved(self, push_notification_mock):
+        builder = PassBuilder(directory=os.path.join(settings.BASE_DIR, 'base_passes', 'StoreCard.pass'))
+        builder.build()
+        instance = builder.write_to_model()
+        instance.save()
+        push_notification_mock.reset_mock()
+        updated_at = instance.updated_at
+        for incremental in (True, False):
+            builder = PassBuilder.read_from_model(instance, incremental=incremental)
+            builder.build()
+            self.assertEqual(builder.digest, instance.digest)
+            with mock.patch.object(instance.data.storage, "save") as save_mock:
+                builder.write_to_model(instance)
+                instance.save()
+            save_mock.assert_not_called()
+        push_notification_mock.assert_not_called()
+        instance.refresh_from_db()
+        self.assertEqual(instance.updated_at, updated_at)
+
+    @mock.patch("django_walletpass.models.Pass.push_notification")
+    def test_unchanged_pass_edited_later_is_saved(self, push_notification_mock):
+        builder = PassBuilder.read_from_model(self.instance, incremental=True)
+        builder.build()
+        builder.write_to_model(self.instance)
+        self.instance.authentication_token = 'new-token'
+        self.instance.save()
+        push_notification_mock.assert_called()
+        self.instance.refresh_from_db()
+        self.assertEqual(self.instance.authentication_token, 'new-token')
+
+    @mock.patch("django_walletpass.models.Pass.push_notification")
+    def test_unchanged_pass_is_skipped_once(self, push_notification_mock):
+        builder = PassBuilder.read_from_model(self.instance, incremental=True)
+        builder.build()
+        builder.write_to_model(self.instance)
+        self.instance.save()
+        self.instance.save()
+        push_notification_mock.assert_called_once()
+
+    @mock.patch("django_walletpass.models.Pass.push_notification")
+    def test_changed_pass_is_saved(self, push_notification_mock):
+        digest = self.instance.digest
+        builder = PassBuilder.read_from_model(self.instance, incremental=True)
+        builder.pass_data['balance'] = 20
+        builder.build()
+        builder.write_to_model(self.instance)
+        self.instance.save()
+        push_notification_mock.assert_called()
+        self.instance.refresh_from_db()
+        self.assertNotEqual(self.instance.digest, digest)
+        self.assertEqual(self.instance.digest, builder.digest)
+
+
+class TemplateCacheTestCase(TestCase):
+    def setUp(self):
+        template_cache.invalidate()
+        self.tmp_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.tmp_dir, 'StoreCard.pass')
+        shutil.copytree(
+            os.path.join(settings.BASE_DIR, 'base_passes', 'StoreCard.pass'),
+            self.directory,
+        )
+
+    def tearDown(self):
+        template_cache.invalidate()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_template_is_reused(self):
+        template = template_cache.get(self.directory)
+        self.assertIs(template_cache.get(self.directory), template)
+        self.assertIn('en.lproj/pass.strings', template.entries)
+        with open(os.path.join(self.directory, 'logo.png'), 'rb') as ffile:
+            self.assertEqual(template.entries['logo.png'].content, ffile.read())
+
+    def test_template_is_reloaded_on_change(self):
+        template = template_cache.get(self.directory)
+        with open(os.path.join(self.directory, 'logo.png'), 'ab') as ffile:
+            ffile.write(b'changed')
+        new_template = template_cache.get(self.directory)
+        self.assertIsNot(new_template, template)
+        self.assertNotEqual(
+            new_template.entries['logo.png'].sha1,
+            template.entries['logo.png'].sha1,
+        )
+
+    def test_invalidate(self):
+        template = template_cache.get(self.directory)
+        template_cache.invalidate(self.directory)
+        self.assertNotIn(self.directory, template_cache)
+        self.assertIsNot(template_cache.get(self.directory), template)
+
+    @mock.patch.dict(WALLETPASS_CONF, {"TEMPLATE_CACHE_SIZE": 1})
+    def test_eviction(self):
+        other_directory = os.path.join(self.tmp_dir, 'Other.pass')
+        shutil.copytree(self.directory, other_directory)
+        template_cache.get(self.directory)
+        template_cache.get(other_directory)
+        self.assertEqual(len(template_cache), 1)
+        self.assertNotIn(self.directory, template_cache)
+        self.assertIn(other_directory, template_cache)
+
+    def test_builder_uses_template_pass_json(self):
+        builder = PassBuilder(directory=self.directory)
+        with open(os.path.join(self.directory, 'pass.json'), 'rb') as ffile:
+            self.assertEqual(builder.pass_data, json.loads(ffile.read()))
+        builder.pass_data['description'] = 'changed'
+        self.assertNotEqual(PassBuilder(directory=self.directory).pass_data, builder.pass_data)
@@ -0,0 +1,131 @@
+import io
+import json
+import os
+import zipfile
+from unittest import mock
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+from django_walletpass.models import Pass, Registration
+from django_walletpass.services import PassBuilder, build_many, bulk_create_passes, bulk_update_passes
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+def keep_pass_data(_pass_data):
+    pass
+
+
+def set_description(pass_data):
+    pass_data["description"] = "updated"
+
+
+def set_description_to_serial_number(pass_data):
+    pass_data["description"] = pass_data["serialNumber"]
+
+
+class BulkTestCase(TestCase):
+    def get_specs(self, count):
+        return [
+            {
+                "pass_data": {"formatVersion": 1, "description": f"pass {i}"},
+                "extra_files": {"extra.txt": f"{i}".encode()},
+            }
+            for i in range(count)
+        ]
+
+    def test_build_many(self):
+        results = list(build_many(self.get_specs(5), workers=2, chunksize=2))
+        self.assertEqual(sorted(result.index for result in results), list(range(5)))
+        for result in results:
+            with zipfile.ZipFile(io.BytesIO(result.content)) as zip_pkpass:
+                pass_data = json.loads(zip_pkpass.read('pass.json'))
+                self.assertEqual(pass_data['description'], f"pass {result.index}")
+                self.assertEqual(pass_data['serialNumber'], result.serial_number)
+                self.assertEqual(zip_pkpass.read('extra.txt'), f"{result.index}".encode())
+
+    def test_bulk_create_passes(self):
+        results = build_many(self.get_specs(3), workers=1)
+        # + select of the created rows where inserts don't return pks
+        queries = 2 if connection.features.can_return_rows_from_bulk_insert else 4
+        with self.assertNumQueries(queries):
+            instances = list(bulk_create_passes(results, batch_size=2))
+        self.assertEqual(Pass.objects.count(), 3)
+        self.assertEqual(
+            sorted(instance.pk for instance in instances),
+            sorted(Pass.objects.values_list("pk", flat=True)),
+        )
+        for instance in instances:
+            builder = PassBuilder.read_from_model(Pass.objects.get(serial_number=instance.serial_number))
+            self.assertEqual(builder.pass_data_required['authenticationToken'], instance.authentication_token)
+
+    def test_bulk_create_passes_without_returning(self):
+        results = build_many(self.get_specs(2), workers=1)
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            instances = list(bulk_create_passes(results))
+        for instance in instances:
+            self.assertEqual(Pass.objects.get(pk=instance.pk).serial_number, instance.serial_number)
+
+    def test_bulk_create_passes_failed_insert_deletes_files(self):
+        results = list(build_many(self.get_specs(2), workers=1))
+        list(bulk_create_passes(results[:1]))
+        storage = Pass().data.storage
+        files = sorted(storage.listdir(WALLETPASS_CONF["UPLOAD_TO"])[1])
+        # duplicated serial number
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            list(bulk_create_passes(results[1:] + results[:1]))
+        self.assertEqual(sorted(storage.listdir(WALLETPASS_CONF["UPLOAD_TO"])[1]), files)
+        self.assertEqual(Pass.objects.count(), 1)
+
+    def create_passes(self, count):
+        serial_numbers = [
+            instance.serial_number for instance in bulk_create_passes(build_many(self.get_specs(count), workers=1))
+        ]
+        instances = list(Pass.objects.filter(serial_number__in=serial_numbers).order_by("pk"))
+        for instance in instances:
+            Registration.objects.create(device_library_identifier="device", push_token="shared", pazz=instance)
+        return instances
+
+    @mock.patch("django_walletpass.services.bulk.push_tokens")
+    @mock.patch.object(Pass, "push_notification")
+    def test_bulk_update_passes(self, push_notification_mock, push_tokens_mock):
+        instances = self.create_passes(3)
+        Registration.objects.create(device_library_identifier="other", push_token="other", pazz=instances[0])
+
+        updated = bulk_update_passes(Pass.objects.all(), set_description_to_serial_number, workers=2, chunksize=1,
+                                     batch_size=2)
+        self.assertEqual(updated, 3)
+        push_notification_mock.assert_not_called()
+        push_tokens_mock.assert_called_once_with({WALLETPASS_CONF["PASS_TYPE_ID"]: {"shared", "other"}})
+        self.assertEqual(len(set(Pass.objects.values_list("updated_at", flat=True))), 1)
+        for instance in instances:
+            stored = Pass.objects.get(pk=instance.pk)
+            self.assertNotEqual(stored.digest, instance.digest)
+            builder = PassBuilder.read_from_model(stored)
+            self.assertEqual(builder.pass_data["description"], instance.serial_number)
+            self.assertEqual(builder.pass_data["authenticationToken"], instance.authentication_token)
+            self.assertIn("extra.txt", builder.extra_files)
+            builder.build()
+            self.assertEqual(builder.digest, stored.digest)
+
+    @mock.patch("django_walletpass.services.bulk.push_tokens")
+    def test_bulk_update_passes_unchanged(self, push_tokens_mock):
+        self.create_passes(2)
+        self.assertEqual(bulk_update_passes(Pass.objects.all(), set_description, workers=1), 2)
+        updated_at = list(Pass.objects.order_by("pk").values_list("updated_at", flat=True))
+        # same pass.json: nothing to write nor push
+        with self.assertNumQueries(1):
+            self.assertEqual(bulk_update_passes(Pass.objects.all(), set_description, workers=1), 0)
+        self.assertEqual(list(Pass.objects.order_by("pk").values_list("updated_at", flat=True)), updated_at)
+        push_tokens_mock.assert_called_once()
+
+    @mock.patch("django_walletpass.services.bulk.push_tokens")
+    def test_bulk_update_passes_unchanged_directory_pass(self, push_tokens_mock):
+        directory = os.path.join(settings.BASE_DIR, 'base_passes', 'StoreCard.pass')
+        for instance in bulk_create_passes(build_many([{"directory": directory}], workers=1)):
+            Registration.objects.create(device_library_identifier="device", push_token="token", pazz=instance)
+        updated_at = Pass.objects.get().updated_at
+        self.assertEqual(bulk_update_passes(Pass.objects.all(), keep_pass_data, workers=1), 0)
+        self.assertEqual(Pass.objects.get().updated_at, updated_at)
+        push_tokens_mock.assert_not_called()
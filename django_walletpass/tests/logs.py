@@ -0,0 +1,210 @@
+import datetime
+import io
+import json
+import re
+import threading
+import time
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+
+from django_walletpass import log_parser, stats
+from django_walletpass.classviews import LogViewSet
+from django_walletpass.models import Log, LogRollup
+from django_walletpass.models.log import PATTERN_GET, PATTERN_REGISTER, PATTERN_WEB_SERVICE_ERROR
+from django_walletpass.services.log_retention import get_cutoff, prune_logs
+from django_walletpass.services.log_writer import BufferedLogWriter, log_writer
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class LogParserTestCase(TestCase):
+    def test_parse_register(self):
+        record = log_parser.parse_message(
+            "[2024-07-08 10:22:35 AM +0200] Register task (for device abc, pass type pass.example, serial number "
+            "123; with web service url https://example.com/passes/) encountered error: Unexpected response code 401"
+        )
+        self.assertEqual(record, log_parser.LogRecord(
+            created_at=datetime.datetime(2024, 7, 8, 10, 22, 35, tzinfo=datetime.timezone(datetime.timedelta(hours=2))),
+            status="error",
+            task_type="Register task",
+            device_id="abc",
+            pass_type_identifier="pass.example",
+            serial_number="123",
+            web_service_url="https://example.com/passes/",
+            msg="Unexpected response code 401",
+        ))
+
+    def test_parse_get_warning(self):
+        record = log_parser.parse_message(
+            "[2024-07-08 22:22:35 +0200] Get pass task (pass type pass.example, serial number 123, "
+            "if-modified-since (null); with web service url https://example.com/passes/) encountered warning: "
+            "Server returned an invalid pass. Missing icon."
+        )
+        self.assertEqual(record.status, "warning")
+        self.assertIsNone(record.device_id)
+        self.assertEqual(record.serial_number, "123")
+        self.assertEqual(record.msg, "Server returned an invalid pass. Missing icon.")
+        self.assertEqual(record.created_at.hour, 22)
+
+    def test_parse_web_service_error(self):
+        record = log_parser.parse_message(
+            "[2024-07-08 10:22:35 AM +0200] Web service error for pass.example (https://example.com/passes/): "
+            "Server returned 500"
+        )
+        self.assertEqual(
+            (record.status, record.task_type, record.pass_type_identifier, record.serial_number),
+            ("error", "Web service error", "pass.example", None),
+        )
+
+    def test_parity_with_legacy_patterns(self):
+        lines = (
+            "[2024-07-08 10:22:35 AM +0200] Register task (for device abc, pass type pass.example, serial number "
+            "a;b; with web service url https://example.com/passes/) encountered error: Unexpected response code 401",
+            "[2024-07-08 10:22:35 AM +0200] Get pass task (pass type pass.example, serial number A,B, "
+            "if-modified-since (null); with web service url https://example.com/passes/) encountered error: "
+            "Unexpected response code 404",
+            "[2024-07-08 10:22:35 AM +0200] Get pass task (pass type pass.example, serial number 123, "
+            "if-modified-since (null); with web service url https://x/(v1)) encountered warning: Missing icon.",
+            "[2024-07-08 10:22:35 AM +0200] Web service error for pass.example (https://x/(v1)): Server returned 500",
+            "[2024-07-08 10:22:35 AM +0200] Register task (for device abc, pass type pass.example, serial number "
+            "a)b; with web service url https://x/(v1)) encountered error: Unexpected response code 401",
+        )
+        for line in lines:
+            record = log_parser.parse_message(line)
+            match_register = re.match(PATTERN_REGISTER, line)
+            match_get = re.match(PATTERN_GET, line)
+            if match_register:
+                expected = match_register.groups()[2:6]
+                fields = (record.device_id, record.pass_type_identifier, record.serial_number, record.web_service_url)
+            elif match_get:
+                expected = match_get.groups()[2:5]
+                fields = (record.pass_type_identifier, record.serial_number, record.web_service_url)
+            else:
+                expected = re.match(PATTERN_WEB_SERVICE_ERROR, line).groups()[2:]
+                fields = (record.pass_type_identifier, record.web_service_url, record.msg)
+            self.assertEqual(fields, expected)
+        self.assertEqual(log_parser.parse_message(lines[0]).serial_number, "a;b")
+        self.assertEqual(log_parser.parse_message(lines[1]).serial_number, "A,B")
+        self.assertEqual(log_parser.parse_message(lines[2]).web_service_url, "https://x/(v1)")
+        self.assertEqual(log_parser.parse_message(lines[3]).web_service_url, "https://x/(v1)")
+
+    def test_crafted_messages_are_parsed_in_linear_time(self):
+        messages = (
+            "[ts] Web service error " + "for x (y " * 450,
+            "[ts] Register task (for device " + "a, pass type b, serial number c; " * 120,
+            "[ts] Get pass task (pass type " + "a, serial number b, if-modified-since (" * 90,
+            "[ts] Web service error " + "for x (y " * 5000,
+        )
+        for message in messages:
+            started = time.perf_counter()
+            self.assertIsNone(log_parser.parse_message(message))
+            self.assertLess(time.perf_counter() - started, 0.1)
+
+    def test_parse_unknown(self):
+        self.assertIsNone(log_parser.parse_message("Passbook fetch failed for some reason"))
+        log = Log.from_message("garbage")
+        self.assertEqual((log.status, log.message), ("unknown", "garbage"))
+
+
+class BufferedLogWriterTestCase(TestCase):
+    @mock.patch.dict(WALLETPASS_CONF, {"LOG_BUFFER": True})
+    @mock.patch.object(log_writer, "put")
+    def test_view_enqueues_logs(self, put_mock):
+        url = reverse('walletpass_log', urlconf='django_walletpass.urls')
+        request = APIRequestFactory().post(url, data=json.dumps({'logs': ["a", "b"]}), content_type='application/json')
+        with self.assertNumQueries(0):
+            response = LogViewSet.as_view({'post': 'create'})(request)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([log.message for log in put_mock.call_args[0][0]], ["a", "b"])
+        self.assertFalse(Log.objects.exists())
+
+    @mock.patch.dict(WALLETPASS_CONF, {"LOG_BUFFER_BATCH_SIZE": 2, "LOG_BUFFER_FLUSH_INTERVAL": 10})
+    @mock.patch.object(BufferedLogWriter, "_write")
+    def test_thread_writes_batches_and_flushes_on_stop(self, write_mock):
+        writer = BufferedLogWriter()
+        written = threading.Event()
+        write_mock.side_effect = lambda batch: written.set()
+        writer.put([Log.from_message(str(i)) for i in range(5)])
+        # full batch written before the flush interval
+        self.assertTrue(written.wait(5))
+        writer.stop()
+        self.assertEqual(sum(len(call[0][0]) for call in write_mock.call_args_list), 5)
+        self.assertTrue(all(len(call[0][0]) <= 2 for call in write_mock.call_args_list))
+
+    @mock.patch.dict(WALLETPASS_CONF, {"LOG_BUFFER_SIZE": 2, "LOG_BUFFER_FULL": "drop"})
+    @mock.patch.object(threading.Thread, "start")
+    def test_drop_when_full(self, _start_mock):
+        stats.reset("logs_dropped")
+        writer = BufferedLogWriter()
+        self.assertEqual(writer.put([Log.from_message(str(i)) for i in range(3)]), 1)
+        self.assertEqual(stats.get("logs_dropped"), 1)
+        writer.flush()
+        self.assertEqual(list(Log.objects.values_list("message", flat=True).order_by("message")), ["0", "1"])
+
+
+class LogRetentionTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        Log.objects.bulk_create(
+            [Log(created_at=now - datetime.timedelta(days=100), status="error", task_type="Register task")
+             for _ in range(3)]
+            + [Log(created_at=now - datetime.timedelta(days=100), status="unknown")]
+            + [Log(created_at=now - datetime.timedelta(days=1), status="error")]
+        )
+
+    def test_prune_logs_in_chunks(self):
+        self.assertEqual(list(prune_logs(get_cutoff(90), chunk_size=3)), [3, 1])
+        self.assertEqual(Log.objects.count(), 1)
+
+    @mock.patch("django_walletpass.management.commands.walletpass_prune_logs.time.sleep")
+    def test_prune_command_with_rollup(self, sleep_mock):
+        out = io.StringIO()
+        call_command('walletpass_prune_logs', days=90, chunk_size=2, sleep=0.5, rollup=True, stdout=out)
+        self.assertIn("Deleted 4 logs", out.getvalue())
+        self.assertEqual(sleep_mock.call_count, 2)
+        self.assertEqual(Log.objects.count(), 1)
+        self.assertEqual(
+            sorted(LogRollup.objects.values_list("status", "task_type", "count")),
+            [("error", "Register task", 3), ("unknown", "", 1)],
+        )
+
+        # logs received late for a rolled up day are added to its counts
+        Log.objects.create(
+            created_at=timezone.now() - datetime.timedelta(days=100), status="error", task_type="Register task",
+        )
+        call_command('walletpass_prune_logs', days=90, rollup=True, stdout=out)
+        self.assertEqual(
+            sorted(LogRollup.objects.values_list("status", "task_type", "count")),
+            [("error", "Register task", 4), ("unknown", "", 1)],
+        )
+        self.assertEqual(Log.objects.count(), 1)
+
+    def test_rollup_counts_every_log_once(self):
+        delete = QuerySet.delete
+        deleted_chunks = []
+
+        def delete_once(queryset):
+            if deleted_chunks:
+                raise DatabaseError
+            deleted_chunks.append(delete(queryset))
+            return deleted_chunks[-1]
+
+        with mock.patch.object(QuerySet, "delete", delete_once):
+            with self.assertRaises(DatabaseError):
+                list(prune_logs(get_cutoff(90), chunk_size=1, rollup=True))
+        # the counts of the failed chunk are rolled back with its delete
+        self.assertEqual(sum(LogRollup.objects.values_list("count", flat=True)), 1)
+        self.assertEqual(Log.objects.count(), 4)
+
+        self.assertEqual(list(prune_logs(get_cutoff(90), chunk_size=1, rollup=True)), [1, 1, 1])
+        self.assertEqual(
+            sorted(LogRollup.objects.values_list("status", "task_type", "count")),
+            [("error", "Register task", 3), ("unknown", "", 1)],
+        )
@@ -1,10 +1,16 @@
 import datetime
+import io
 import json
+import os
+import time
+import zipfile
 from unittest import mock
 
 from aioapns.common import APNS_RESPONSE_CODE
 from dateutil.parser import parse
+from django.conf import settings
 from django.contrib import admin
+from django.db import IntegrityError
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
@@ -16,8 +22,9 @@ from django_walletpass.admin import PassAdmin
 from django_walletpass.classviews import FORMAT, LogViewSet, RegisterPassViewSet
 from django_walletpass.models import Log, Pass, Registration
 from django_walletpass.services import PassBuilder, PushBackend
+from django_walletpass.services.push_backend import apns_clients
 from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
-from django_walletpass.signals import delete_registration
+from django_walletpass.signals import collect_gone_tokens, delete_registration
 
 
 class AdminTestCase(TestCase):
@@ -69,6 +76,17 @@ class CryptoTestCase(TestCase):
             key_password=WALLETPASS_CONF["KEY_PASSWORD"],
         )
 
+    def test_signer_is_reused(self):
+        signer = crypto.get_signer()
+        self.assertIs(crypto.get_signer(), signer)
+        signature = signer.sign(b"data to be signed")
+        self.assertTrue(signature)
+
+    def test_signer_is_rebuilt_on_setting_changed(self):
+        signer = crypto.get_signer()
+        with override_settings(WALLETPASS=settings.WALLETPASS):
+            self.assertIsNot(crypto.get_signer(), signer)
+
 
 class BuilderTestCase(TestCase):
     def test_build_pkpass(self):
@@ -112,8 +130,38 @@ class BuilderTestCase(TestCase):
         self.assertNotEqual(builder.manifest_dict, builder3.manifest_dict)
         self.assertNotEqual(builder.pass_data, builder3.pass_data)
 
+    @mock.patch("django_walletpass.services.pass_builder.time.localtime")
+    @mock.patch("django_walletpass.services.pass_builder.crypto.get_signer")
+    def test_build_in_memory_same_as_tmp_dir(self, get_signer_mock, localtime_mock):
+        get_signer_mock.return_value.sign.return_value = b"signature"
+        localtime_mock.return_value = time.struct_time((2026, 1, 2, 3, 4, 6, 0, 1, 0))
+        builder = PassBuilder(
+            directory=os.path.join(settings.BASE_DIR, 'base_passes', 'StoreCard.pass')
+        )
+        builder.add_file('extra/file.txt', b'extra content')
+
+        in_memory_content = builder.build()
+        in_memory_manifest = dict(builder.manifest_dict)
+        tmp_dir_content = builder.build(in_memory=False)
+
+        self.assertEqual(in_memory_content, tmp_dir_content)
+        self.assertEqual(in_memory_manifest, builder.manifest_dict)
+        with zipfile.ZipFile(io.BytesIO(in_memory_content)) as zip_pkpass:
+            self.assertEqual(zip_pkpass.read('extra/file.txt'), b'extra content')
+            self.assertEqual(zip_pkpass.read('signature'), b'signature')
+            self.assertEqual(
+                json.loads(zip_pkpass.read('manifest.json')),
+                builder.manifest_dict,
+            )
+            self.assertIn('en.lproj/pass.strings', zip_pkpass.namelist())
+
 
 class ModelTestCase(TestCase):
+    def setUp(self):
+        # clients created with a mocked APNs.__init__ must not be reused
+        apns_clients.clear()
+        self.addCleanup(apns_clients.clear)
+
     @mock.patch("django_walletpass.models.Pass.get_registrations")
     @mock.patch("django_walletpass.services.push_backend.APNs.send_notification")
     def test_push_notification(self, send_notification_mock, get_registrations_mock):
@@ -127,6 +175,10 @@ class ModelTestCase(TestCase):
 
 
 class ServiceTestCase(TestCase):
+    def setUp(self):
+        apns_clients.clear()
+        self.addCleanup(apns_clients.clear)
+
     @mock.patch("django_walletpass.services.push_backend.APNs.send_notification")
     def test_send_notification(self, send_notification_mock):
         registration = Registration(push_token="random-token")
@@ -145,12 +197,13 @@ class ServiceTestCase(TestCase):
         }
     )
     @mock.patch("django_walletpass.services.push_backend.NotificationRequest")
-    @mock.patch("django_walletpass.signals.Registration")
+    @mock.patch("django_walletpass.models.mpass.Registration")
     def test_send_notification_registration_gone(
         self, registration_mock, request_mock
     ):
         """when registration is reported 410 GONE by service, APN service
         remove registration object"""
+        registration_mock.unregister_tokens.return_value = set()
         registration = Registration(push_token="random-token")
         response_mock = mock.Mock()
         response_mock.is_successful = False
@@ -164,17 +217,29 @@ class ServiceTestCase(TestCase):
             backend.push_notification_from_instance(registration)
 
         # signal handler must be called
-        registration_mock.objects.get.assert_called_with(
-            push_token=request_mock().device_token
+        registration_mock.unregister_tokens.assert_called_with(
+            [request_mock().device_token]
         )
 
 
 class SignalTestCase(TestCase):
-    @mock.patch("django_walletpass.signals.Registration")
-    @mock.patch("django_walletpass.signals.PASS_UNREGISTERED")
-    def test_delete_registration(self, pass_unregistered_mock, registration_mock):
-        """signal handler must delete registration and trigger signal"""
-        request_mock, response_mock = mock.Mock(), mock.Mock()
+    def setUp(self):
+        self.passes = []
+        for _ in range(2):
+            builder = PassBuilder()
+            builder.pass_data = {"formatVersion": 1}
+            builder.build()
+            pass_ = builder.write_to_model()
+            pass_.save()
+            self.passes.append(pass_)
+            # same device, same token
+            Registration.objects.create(device_library_identifier="device", push_token="token", pazz=pass_)
+        Registration.objects.create(device_library_identifier="other", push_token="other", pazz=self.passes[0])
+
+    @mock.patch("django_walletpass.models.mpass.PASS_UNREGISTERED")
+    def test_delete_registration(self, pass_unregistered_mock):
+        """signal handler must delete registrations and trigger signal"""
+        request_mock, response_mock = mock.Mock(device_token="token"), mock.Mock()
         response_mock.is_successful = False
         response_mock.status = APNS_RESPONSE_CODE.GONE
         delete_registration(
@@ -182,10 +247,43 @@ class SignalTestCase(TestCase):
             notification_request=request_mock,
             notification_result=response_mock
         )
-        # Registration obj must be deleted
-        registration_mock.objects.get.return_value.delete.assert_called_with()
-        # Signal must be sent
-        pass_unregistered_mock.send.assert_called()
+        # Registration objs of the token must be deleted
+        self.assertEqual(list(Registration.objects.values_list("push_token", flat=True)), ["other"])
+        # Signal must be sent once per pass
+        self.assertEqual(
+            sorted(call.kwargs["sender"].pk for call in pass_unregistered_mock.send.call_args_list),
+            sorted(pass_.pk for pass_ in self.passes),
+        )
+
+    @mock.patch("django_walletpass.models.mpass.PASS_UNREGISTERED")
+    def test_collect_gone_tokens(self, pass_unregistered_mock):
+        response_mock = mock.Mock(status=APNS_RESPONSE_CODE.GONE)
+        with collect_gone_tokens() as gone_tokens:
+            for token in ["token", "other"]:
+                delete_registration(
+                    sender='aioapns',
+                    notification_request=mock.Mock(device_token=token),
+                    notification_result=response_mock,
+                )
+        self.assertEqual(gone_tokens, {"token", "other"})
+        self.assertEqual(Registration.objects.count(), 3)
+
+        # pass ids + delete + passes
+        with self.assertNumQueries(3):
+            Pass.unregister_tokens(gone_tokens)
+        self.assertFalse(Registration.objects.exists())
+        self.assertEqual(pass_unregistered_mock.send.call_count, 2)
+
+    def test_push_token_hash(self):
+        registration = Registration.objects.get(device_library_identifier="other")
+        self.assertEqual(registration.push_token_hash, Registration.hash_token("other"))
+        registration.push_token = "new"
+        registration.save(update_fields=["push_token"])
+        registration.refresh_from_db()
+        self.assertEqual(registration.push_token_hash, Registration.hash_token("new"))
+        Registration.register("other", self.passes[0].pk, "newer")
+        registration.refresh_from_db()
+        self.assertEqual(registration.push_token_hash, Registration.hash_token("newer"))
 
 
 class RegisterPassViewSetTestCase(APITestCase):
@@ -266,6 +364,63 @@ class RegisterPassViewSetTestCase(APITestCase):
         self.assertTrue(Registration.objects.filter(device_library_identifier=self.device_library_id,
                                                     pazz=self.pass_instance).exists())
 
+    def register(self, device_library_id, push_token):
+        url = reverse(
+            'walletpass_register_pass',
+            args=[device_library_id, self.pass_type_id, self.pass_instance.serial_number],
+            urlconf='django_walletpass.urls',
+        )
+        request = self.factory.post(
+            url,
+            data=json.dumps({'pushToken': push_token}),
+            content_type='application/json',
+            HTTP_AUTHORIZATION=f'ApplePass {self.pass_instance.authentication_token}',
+        )
+        return RegisterPassViewSet.as_view({'post': 'create'})(
+            request,
+            device_library_id=device_library_id,
+            pass_type_id=self.pass_type_id,
+            serial_number=self.pass_instance.serial_number,
+        )
+
+    @mock.patch("django_walletpass.classviews.PASS_REGISTERED")
+    def test_create_registration(self, pass_registered_mock):
+        response = self.register('new-device', 'token')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        pass_registered_mock.send.assert_called_once_with(sender=self.pass_instance)
+        self.assertEqual(Registration.objects.get(device_library_identifier='new-device').push_token, 'token')
+
+    @mock.patch("django_walletpass.classviews.PASS_REGISTERED")
+    def test_create_existing_registration_updates_token(self, pass_registered_mock):
+        # select pass + update registration
+        with self.assertNumQueries(2):
+            response = self.register(self.device_library_id, 'new-token')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pass_registered_mock.send.assert_not_called()
+        self.assertEqual(Registration.objects.get().push_token, 'new-token')
+
+    @mock.patch("django_walletpass.classviews.PASS_UNREGISTERED")
+    def test_destroy_in_one_query(self, pass_unregistered_mock):
+        url = reverse(
+            'walletpass_register_pass',
+            args=[self.device_library_id, self.pass_type_id, self.pass_instance.serial_number],
+            urlconf='django_walletpass.urls',
+        )
+        request = self.factory.delete(url, HTTP_AUTHORIZATION=f'ApplePass {self.pass_instance.authentication_token}')
+        # select pass + delete
+        with self.assertNumQueries(2):
+            response = self.view(request,
+                                 device_library_id=self.device_library_id,
+                                 pass_type_id=self.pass_type_id,
+                                 serial_number=self.pass_instance.serial_number)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pass_unregistered_mock.send.assert_called_once_with(sender=self.pass_instance)
+        self.assertFalse(Registration.objects.exists())
+
+    def test_registration_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Registration.objects.create(device_library_identifier=self.device_library_id, pazz=self.pass_instance)
+
 
 class LogViewSetTestCase(APITestCase):
     def setUp(self):
@@ -292,3 +447,37 @@ class LogViewSetTestCase(APITestCase):
         expected_utc_timestamp = expected_timestamp.astimezone(datetime.timezone.utc)
 
         self.assertEqual(created_log.created_at, expected_utc_timestamp)
+
+    def test_create_logs_in_batch(self):
+        passes = []
+        for _ in range(2):
+            builder = PassBuilder()
+            builder.pass_data = {"formatVersion": 1}
+            builder.build()
+            instance = builder.write_to_model()
+            instance.save()
+            passes.append(instance)
+        pass_type_id = passes[0].pass_type_identifier
+        messages = [
+            f"[2024-07-08 10:22:35 AM +0200] Register task (for device abc, pass type {pass_type_id}, serial number "
+            f"{pass_.serial_number}; with web service url https://example.com/passes/) encountered error: "
+            "Unexpected response code 401"
+            for pass_ in passes
+        ] + [
+            f"[2024-07-08 10:22:36 AM +0200] Get pass task (pass type {pass_type_id}, serial number "
+            f"{passes[0].serial_number}, if-modified-since (null); with web service url https://example.com/passes/) "
+            "encountered error: Unexpected response code 500",
+            "garbage",
+        ]
+        url = reverse('walletpass_log', urlconf='django_walletpass.urls')
+        request = self.factory.post(url, data=json.dumps({'logs': messages}), content_type='application/json')
+        view = LogViewSet.as_view({'post': 'create'})
+        # select passes + insert logs
+        with self.assertNumQueries(2):
+            response = view(request)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Log.objects.count(), 4)
+        self.assertEqual(Log.objects.filter(pazz=passes[0]).count(), 2)
+        self.assertEqual(Log.objects.filter(pazz=passes[1], device_id="abc", status="error").count(), 1)
+        self.assertEqual(Log.objects.filter(status="unknown", message="garbage").count(), 1)
@@ -0,0 +1,373 @@
+import asyncio
+import datetime
+import io
+import ssl
+import time
+from unittest import mock
+
+from aioapns.common import APNS_RESPONSE_CODE
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from django_walletpass import apns_server, stats
+from django_walletpass.management.commands.walletpass_bench_push import LocalPushBackend
+from django_walletpass.models import Pass, PushOutbox, Registration
+from django_walletpass.services import PassBuilder, PushBackend, push_passes
+from django_walletpass.services.push_backend import PushResult, apns_clients, get_retry_delay
+from django_walletpass.services.push_outbox import process_outbox
+from django_walletpass.services.rate_limit import TokenBucket, rate_limiters
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+from django_walletpass.signals import collect_gone_tokens
+
+
+class PushFanOutTestCase(TestCase):
+    def setUp(self):
+        builder = PassBuilder()
+        builder.pass_data = {"formatVersion": 1}
+        builder.build()
+        self.pass_ = builder.write_to_model()
+        self.pass_.save()
+        for i in range(3):
+            Registration.objects.create(
+                device_library_identifier=f"device{i}",
+                push_token=f"token{i}",
+                pazz=self.pass_,
+            )
+
+    @mock.patch.object(PushBackend, "get_client")
+    def test_gone_registrations_are_deleted_in_one_query(self, _get_client_mock):
+        async def send_notification(_self, _client, token):
+            status_code = APNS_RESPONSE_CODE.GONE if token == "token1" else APNS_RESPONSE_CODE.SUCCESS
+            return mock.Mock(status=status_code)
+
+        with mock.patch.object(PushBackend, "send_notification", send_notification), \
+                mock.patch("django_walletpass.models.mpass.PASS_UNREGISTERED") as pass_unregistered_mock:
+            # select registrations + unregister gone tokens (pass ids, delete, passes)
+            with self.assertNumQueries(4):
+                self.pass_.push_notification()
+        pass_unregistered_mock.send.assert_called_once_with(sender=self.pass_)
+        self.assertEqual(
+            sorted(Registration.objects.values_list("push_token", flat=True)),
+            ["token0", "token2"],
+        )
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_CONCURRENCY": 2})
+    @mock.patch.object(PushBackend, "get_client")
+    def test_pushes_are_concurrent_and_bounded(self, _get_client_mock):
+        in_flight = []
+        max_in_flight = []
+        pushed = []
+
+        async def send_notification(_self, _client, token):
+            in_flight.append(token)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(token)
+            pushed.append(token)
+            return mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS)
+
+        with mock.patch.object(PushBackend, "send_notification", send_notification):
+            self.pass_.push_notification()
+        self.assertEqual(sorted(pushed), ["token0", "token1", "token2"])
+        self.assertEqual(max(max_in_flight), 2)
+
+
+class InstancePushBackend:
+    """Push class implementing only push_notification_from_instance()"""
+    pushed = []
+
+    def push_notification_from_instance(self, registration):
+        self.pushed.append(registration.push_token)
+        status_code = APNS_RESPONSE_CODE.GONE if registration.push_token == "gone" else APNS_RESPONSE_CODE.SUCCESS
+        return mock.Mock(status=status_code)
+
+
+class PushPassesTestCase(TestCase):
+    def setUp(self):
+        self.passes = []
+        for i in range(3):
+            builder = PassBuilder()
+            builder.pass_data = {"formatVersion": 1}
+            builder.build()
+            pass_ = builder.write_to_model()
+            pass_.pass_type_identifier = "pass.other" if i == 2 else "pass.main"
+            pass_.save()
+            self.passes.append(pass_)
+            # one device with every pass
+            Registration.objects.create(device_library_identifier="device", push_token="shared", pazz=pass_)
+        Registration.objects.create(device_library_identifier="gone", push_token="gone", pazz=self.passes[0])
+        Registration.objects.create(device_library_identifier="gone", push_token="gone", pazz=self.passes[1])
+
+    @mock.patch.object(PushBackend, "get_client")
+    def test_each_token_is_pushed_once_per_topic(self, get_client_mock):
+        get_client_mock.side_effect = lambda topic=None, loop=None: topic
+        pushed = []
+
+        async def send_notification(_self, client, token):
+            pushed.append((client, token))
+            status_code = APNS_RESPONSE_CODE.GONE if token == "gone" else APNS_RESPONSE_CODE.SUCCESS
+            return mock.Mock(status=status_code)
+
+        with mock.patch.object(PushBackend, "send_notification", send_notification), \
+                mock.patch("django_walletpass.models.mpass.PASS_UNREGISTERED") as pass_unregistered_mock:
+            # tokens + unregister gone tokens (pass ids, delete, passes)
+            with self.assertNumQueries(4):
+                self.assertEqual(push_passes(Pass.objects.all(), batch_size=1), 3)
+        self.assertEqual(
+            sorted(pushed),
+            [("pass.main", "gone"), ("pass.main", "shared"), ("pass.other", "shared")],
+        )
+        self.assertFalse(Registration.objects.filter(push_token="gone").exists())
+        self.assertEqual(pass_unregistered_mock.send.call_count, 2)
+
+    @mock.patch.dict(WALLETPASS_CONF, {"WALLETPASS_PUSH_CLASS": "django_walletpass.tests.push.InstancePushBackend"})
+    def test_push_class_without_push_notification_with_tokens(self):
+        InstancePushBackend.pushed = []
+        with mock.patch("django_walletpass.models.mpass.PASS_UNREGISTERED"):
+            self.assertEqual(push_passes(Pass.objects.all()), 3)
+        self.assertEqual(sorted(InstancePushBackend.pushed), ["gone", "shared", "shared"])
+        self.assertFalse(Registration.objects.filter(push_token="gone").exists())
+
+    @mock.patch.object(PushBackend, "push_notification_with_tokens")
+    def test_no_registrations(self, push_mock):
+        self.assertEqual(push_passes(Pass.objects.none()), 0)
+        push_mock.assert_not_called()
+
+
+class PushOutboxTestCase(TestCase):
+    def setUp(self):
+        builder = PassBuilder()
+        builder.pass_data = {"formatVersion": 1}
+        builder.build()
+        with mock.patch.object(Pass, "push_notification"):
+            self.pass_ = builder.write_to_model()
+            self.pass_.save()
+        for i in range(2):
+            Registration.objects.create(
+                device_library_identifier=f"device{i}",
+                push_token=f"token{i}",
+                pazz=self.pass_,
+            )
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_OUTBOX": True})
+    @mock.patch.object(Pass, "push_notification")
+    def test_save_enqueues_instead_of_pushing(self, push_notification_mock):
+        self.pass_.save()
+        push_notification_mock.assert_not_called()
+        self.assertEqual(PushOutbox.objects.filter(pazz=self.pass_).count(), 1)
+
+    def test_claimed_entries_are_leased(self):
+        PushOutbox.enqueue(self.pass_)
+        self.assertEqual(len(PushOutbox.claim(10, lease=60)), 1)
+        self.assertEqual(PushOutbox.claim(10, lease=60), [])
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_OUTBOX": True, "PUSH_DEBOUNCE_SECONDS": 30})
+    def test_saves_in_debounce_window_are_coalesced(self):
+        stats.reset("push_suppressed")
+        before = timezone.now()
+        for _ in range(3):
+            self.pass_.save()
+        entry = PushOutbox.objects.get(pazz=self.pass_)
+        self.assertEqual(entry.coalesced, 2)
+        self.assertGreaterEqual(entry.next_attempt_at, before + datetime.timedelta(seconds=30))
+        self.assertEqual(stats.get("push_suppressed"), 2)
+        # not due yet
+        self.assertEqual(PushOutbox.claim(10, lease=60), [])
+
+    def test_save_after_claim_enqueues_again(self):
+        PushOutbox.enqueue(self.pass_)
+        PushOutbox.claim(10, lease=60)
+        self.assertIsNotNone(PushOutbox.enqueue(self.pass_))
+        self.assertEqual(PushOutbox.objects.filter(pazz=self.pass_).count(), 2)
+
+    @mock.patch.object(Pass, "push_registrations")
+    def test_process_outbox_pushes_once_per_pass(self, push_registrations_mock):
+        push_registrations_mock.return_value = [
+            mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS),
+            mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS),
+        ]
+        # e.g. enqueued by two processes at once
+        PushOutbox.objects.create(pazz=self.pass_)
+        PushOutbox.objects.create(pazz=self.pass_)
+        self.assertEqual(process_outbox(), 2)
+        push_registrations_mock.assert_called_once()
+        self.assertEqual(len(push_registrations_mock.call_args[0][0]), 2)
+        self.assertFalse(PushOutbox.objects.exists())
+        self.assertEqual(process_outbox(), 0)
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_OUTBOX_MAX_ATTEMPTS": 2, "PUSH_OUTBOX_RETRY_DELAY": 10})
+    @mock.patch.object(Pass, "push_registrations")
+    def test_failed_pushes_are_retried_with_backoff(self, push_registrations_mock):
+        push_registrations_mock.return_value = [
+            mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS),
+            mock.Mock(status=APNS_RESPONSE_CODE.SERVICE_UNAVAILABLE, description="ServiceUnavailable"),
+        ]
+        PushOutbox.enqueue(self.pass_)
+        before = timezone.now()
+        process_outbox()
+        entry = PushOutbox.objects.get()
+        self.assertEqual(entry.attempts, 1)
+        self.assertIn("503", entry.last_error)
+        self.assertGreaterEqual(entry.next_attempt_at, before + datetime.timedelta(seconds=10))
+
+        PushOutbox.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs("walletpass.services", "ERROR"):
+            process_outbox()
+        self.assertFalse(PushOutbox.objects.exists())
+
+    @mock.patch.object(Pass, "push_registrations")
+    def test_retry_later_results_are_retried(self, push_registrations_mock):
+        push_registrations_mock.return_value = [
+            PushResult("token0", PushResult.RETRY_LATER, None, "reset", 3),
+            PushResult("token1", PushResult.FATAL, "400", "BadDeviceToken", 1),
+        ]
+        PushOutbox.enqueue(self.pass_)
+        process_outbox()
+        self.assertEqual(PushOutbox.objects.get().last_error, "reset")
+
+
+class PushRetryTestCase(TestCase):
+    def setUp(self):
+        rate_limiters.clear()
+        self.addCleanup(rate_limiters.clear)
+        patcher = mock.patch("django_walletpass.services.push_backend.get_retry_delay", return_value=0)
+        self.get_retry_delay_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def push(self, *responses):
+        with mock.patch.object(PushBackend, "get_client"), \
+                mock.patch.object(PushBackend, "send_notification", side_effect=responses) as send_notification_mock:
+            result = PushBackend().push_notification_with_token("token")
+        self.assertEqual(send_notification_mock.call_count, result.attempts)
+        return result
+
+    def test_success(self):
+        result = self.push(mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS))
+        self.assertEqual((result.token, result.outcome, result.attempts), ("token", PushResult.SUCCESS, 1))
+        self.assertTrue(result.is_successful)
+
+    def test_gone_is_not_retried(self):
+        result = self.push(mock.Mock(status=APNS_RESPONSE_CODE.GONE))
+        self.assertEqual((result.outcome, result.status, result.attempts), (PushResult.GONE, "410", 1))
+
+    def test_retryable_statuses_are_retried(self):
+        with self.assertLogs("walletpass.services", "WARNING"):
+            result = self.push(
+                mock.Mock(status=APNS_RESPONSE_CODE.TOO_MANY_REQUESTS),
+                ConnectionError("reset"),
+                mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS),
+            )
+        self.assertEqual((result.outcome, result.attempts), (PushResult.SUCCESS, 3))
+        self.assertEqual([c.args for c in self.get_retry_delay_mock.call_args_list], [(1,), (2,)])
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_RETRIES": 1})
+    def test_retry_later_after_retries(self):
+        result = self.push(*[mock.Mock(status=APNS_RESPONSE_CODE.SERVICE_UNAVAILABLE, description="down")] * 2)
+        self.assertEqual(
+            (result.outcome, result.status, result.description, result.attempts),
+            (PushResult.RETRY_LATER, "503", "down", 2),
+        )
+
+    def test_fatal_errors_are_not_retried(self):
+        with self.assertLogs("walletpass.services", "ERROR"):
+            result = self.push(ssl.SSLError("bad cert"))
+        self.assertEqual((result.outcome, result.status, result.attempts), (PushResult.FATAL, None, 1))
+        result = self.push(mock.Mock(status=APNS_RESPONSE_CODE.BAD_REQUEST))
+        self.assertEqual((result.outcome, result.attempts), (PushResult.FATAL, 1))
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_RETRY_DELAY": 1, "PUSH_RETRY_MAX_DELAY": 10})
+    def test_get_retry_delay(self):
+        self.get_retry_delay_mock.stop()
+        for attempt, (low, high) in [(1, (0.5, 1)), (2, (1, 2)), (10, (5, 10))]:
+            for _ in range(20):
+                self.assertTrue(low <= get_retry_delay(attempt) <= high)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = time.monotonic()
+        self.assertEqual([bucket.reserve(now), bucket.reserve(now)], [0, 0])
+        self.assertAlmostEqual(bucket.reserve(now), 0.5)
+        self.assertEqual(bucket.reserve(now + 0.5), 0)
+
+    def test_rate_limiters(self):
+        self.assertIsNone(rate_limiters.get("pass.topic"))
+        with mock.patch.dict(WALLETPASS_CONF, {"PUSH_RATE_LIMIT": 100}):
+            bucket = rate_limiters.get("pass.topic")
+            self.assertEqual(bucket.capacity, 100)
+            self.assertIs(rate_limiters.get("pass.topic"), bucket)
+            self.assertIsNot(rate_limiters.get("pass.other"), bucket)
+
+    @mock.patch.dict(WALLETPASS_CONF, {"PUSH_RATE_LIMIT": 1000, "PUSH_RATE_BURST": 1})
+    @mock.patch.object(TokenBucket, "acquire")
+    def test_pushes_wait_for_rate_limiter(self, acquire_mock):
+        self.push(mock.Mock(status=APNS_RESPONSE_CODE.SUCCESS))
+        acquire_mock.assert_called_once_with()
+
+
+class APNsServerTestCase(TestCase):
+    def setUp(self):
+        apns_clients.clear()
+        self.addCleanup(apns_clients.close)
+
+    def test_response_plan(self):
+        plan = apns_server.ResponsePlan(apns_server.parse_statuses("200=3,410=1"), latency=0.1, seed=0)
+        responses = [plan.choose() for _ in range(100)]
+        self.assertEqual({delay for _status, delay in responses}, {0.1})
+        self.assertEqual(set(plan.counts), {"200", "410"})
+        self.assertEqual(sum(plan.counts.values()), 100)
+        plan = apns_server.ResponsePlan(spike_rate=1, spike_latency=2)
+        self.assertEqual(plan.choose(), ("200", 2))
+
+    def test_push_to_local_server(self):
+        with apns_server.LocalAPNsServer(apns_server.ResponsePlan({"410": 1})) as server, \
+                mock.patch.object(LocalPushBackend, "server", server), collect_gone_tokens() as gone_tokens:
+            results = LocalPushBackend().push_notification_with_tokens(["token0", "token1"])
+            apns_clients.close()
+        self.assertEqual([result.outcome for result in results], [PushResult.GONE] * 2)
+        self.assertEqual(results[0].description, "Unregistered")
+        self.assertEqual(gone_tokens, {"token0", "token1"})
+
+    def test_bench_push_command(self):
+        out = io.StringIO()
+        call_command("walletpass_bench_push", registrations=[20], statuses="200=1", stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:2] for line in lines[1:]], [["backend", "20"], ["pass", "20"]])
+        self.assertTrue(all(line.endswith("200=20") for line in lines[1:]))
+        self.assertFalse(Registration.objects.exists())
+        self.assertEqual(WALLETPASS_CONF["WALLETPASS_PUSH_CLASS"], "django_walletpass.services.PushBackend")
+
+
+class APNsClientPoolTestCase(TestCase):
+    def setUp(self):
+        apns_clients.clear()
+        self.addCleanup(apns_clients.clear)
+
+    @mock.patch.object(PushBackend, "create_client")
+    def test_client_is_reused(self, create_client_mock):
+        create_client_mock.side_effect = lambda topic: mock.Mock(topic=topic)
+        client = PushBackend().get_client()
+        self.assertIs(PushBackend().get_client(), client)
+        self.assertEqual(client.topic, WALLETPASS_CONF["PASS_TYPE_ID"])
+        other = PushBackend().get_client(topic="pass.other")
+        self.assertIsNot(other, client)
+        self.assertEqual(create_client_mock.call_count, 2)
+
+    @mock.patch.object(PushBackend, "create_client")
+    def test_idle_clients_are_reaped(self, create_client_mock):
+        client = PushBackend().get_client()
+        apns_clients.reap(idle_timeout=0, now=time.monotonic() + 1)
+        self.assertEqual(len(apns_clients), 0)
+        client.pool.close.assert_called_once_with()
+        PushBackend().get_client()
+        self.assertEqual(create_client_mock.call_count, 2)
+
+    @mock.patch.object(PushBackend, "create_client")
+    def test_clients_are_closed_on_setting_changed(self, create_client_mock):
+        client = PushBackend().get_client()
+        with override_settings(WALLETPASS=settings.WALLETPASS):
+            self.assertEqual(len(apns_clients), 0)
+        client.pool.close.assert_called_once_with()
+        PushBackend().get_client()
+        self.assertEqual(create_client_mock.call_count, 2)
@@ -0,0 +1,191 @@
+import datetime
+from unittest import mock
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from django_walletpass import pass_cache
+from django_walletpass.classviews import FORMAT, LatestVersionViewSet, RegistrationsViewSet
+from django_walletpass.models import Pass, Registration
+from django_walletpass.services import PassBuilder, build_many, bulk_create_passes
+from django_walletpass.settings import dwpconfig as WALLETPASS_CONF
+
+
+class RegistrationsViewSetTestCase(APITestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.device_library_id = 'ebc6fdbd52ffd906fc294aba259f239c'
+        self.passes = list(bulk_create_passes(build_many([{"pass_data": {"formatVersion": 1}}] * 3, workers=1)))
+        for pass_ in self.passes:
+            Registration.objects.create(device_library_identifier=self.device_library_id, pazz=pass_)
+        self.pass_type_id = self.passes[0].pass_type_identifier
+        self.last_updated = timezone.now()
+        Pass.objects.filter(pk__in=[p.pk for p in self.passes[1:]]).update(updated_at=self.last_updated)
+        Pass.objects.filter(pk=self.passes[0].pk).update(
+            updated_at=self.last_updated - datetime.timedelta(days=1),
+        )
+        self.view = RegistrationsViewSet.as_view({'get': 'list'})
+
+    def list(self, device_library_id, data=None):
+        url = reverse(
+            'walletpass_registrations',
+            args=[device_library_id, self.pass_type_id],
+            urlconf='django_walletpass.urls',
+        )
+        request = self.factory.get(url, data)
+        return self.view(request, device_library_id=device_library_id, pass_type_id=self.pass_type_id)
+
+    def test_list_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.list(self.device_library_id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['lastUpdated'], self.last_updated.isoformat())
+        self.assertEqual(
+            sorted(response.data['serialNumbers']),
+            sorted(p.serial_number for p in self.passes[1:]),
+        )
+
+    def test_list_updated_since(self):
+        since = (self.last_updated - datetime.timedelta(hours=1)).isoformat()
+        with self.assertNumQueries(1):
+            response = self.list(self.device_library_id, {'passesUpdatedSince': since})
+        self.assertEqual(len(response.data['serialNumbers']), 2)
+
+        with self.assertNumQueries(1):
+            response = self.list(self.device_library_id, {'passesUpdatedSince': self.last_updated.isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_list_updated_since_legacy_format(self):
+        since = timezone.localtime(self.last_updated - datetime.timedelta(hours=1)).strftime(FORMAT)
+        response = self.list(self.device_library_id, {'passesUpdatedSince': since})
+        self.assertEqual(len(response.data['serialNumbers']), 2)
+
+    def test_list_unknown_device(self):
+        with self.assertNumQueries(1):
+            response = self.list('unknown')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LatestVersionViewSetTestCase(APITestCase):
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        builder = PassBuilder()
+        builder.pass_data = {"formatVersion": 1}
+        builder.build()
+        self.pass_instance = builder.write_to_model()
+        self.pass_instance.save()
+        self.view = LatestVersionViewSet.as_view({'get': 'retrieve'})
+
+    def retrieve(self, **headers):
+        url = reverse(
+            'walletpass_latest_version',
+            args=[self.pass_instance.pass_type_identifier, self.pass_instance.serial_number],
+            urlconf='django_walletpass.urls',
+        )
+        headers.setdefault('HTTP_AUTHORIZATION', f'ApplePass {self.pass_instance.authentication_token}')
+        request = self.factory.get(url, **headers)
+        return self.view(
+            request,
+            pass_type_id=self.pass_instance.pass_type_identifier,
+            serial_number=self.pass_instance.serial_number,
+        )
+
+    def test_retrieve(self):
+        response = self.retrieve()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.pkpass')
+        self.assertEqual(response['ETag'], f'"{self.pass_instance.digest}"')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=pass.pkpass')
+        self.assertIn('Last-Modified', response)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.pass_instance.data.open('rb')
+        self.assertEqual(content, self.pass_instance.data.read())
+        self.pass_instance.data.close()
+
+    @mock.patch.dict(WALLETPASS_CONF, {"STORAGE_SENDFILE": "x-accel-redirect", "STORAGE_SENDFILE_PREFIX": "/internal/"})
+    def test_retrieve_x_accel_redirect(self):
+        response = self.retrieve()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/{self.pass_instance.data.name}')
+        self.assertEqual(response.content, b'')
+
+    @mock.patch.dict(WALLETPASS_CONF, {"STORAGE_SENDFILE": "x-sendfile"})
+    def test_retrieve_x_sendfile(self):
+        response = self.retrieve()
+        self.assertEqual(response['X-Sendfile'], self.pass_instance.data.path)
+
+    @mock.patch.dict(WALLETPASS_CONF, {"STORAGE_SENDFILE": "x-sendfile"})
+    def test_retrieve_sendfile_falls_back_to_streaming(self):
+        with mock.patch.object(type(self.pass_instance.data), 'path', new_callable=mock.PropertyMock,
+                               side_effect=NotImplementedError):
+            response = self.retrieve()
+        self.assertNotIn('X-Sendfile', response)
+        self.assertTrue(response.streaming)
+        response.close()
+
+    def test_not_modified_does_not_read_storage(self):
+        response = self.retrieve()
+        with mock.patch.object(type(self.pass_instance.data), 'read') as read_mock, \
+                mock.patch.object(type(self.pass_instance.data), 'open') as open_mock:
+            for headers in (
+                {'HTTP_IF_NONE_MATCH': response['ETag']},
+                {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+            ):
+                not_modified = self.retrieve(**headers)
+                self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(not_modified['ETag'], response['ETag'])
+        read_mock.assert_not_called()
+        open_mock.assert_not_called()
+
+    def test_stale_etag(self):
+        response = self.retrieve(HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@mock.patch.dict(WALLETPASS_CONF, {"PASS_CACHE": "default"})
+class PassCacheTestCase(LatestVersionViewSetTestCase):
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+
+    def test_cached_paths_without_queries(self):
+        response = self.retrieve()
+        response.close()
+        with self.assertNumQueries(0):
+            not_modified = self.retrieve(HTTP_IF_NONE_MATCH=response['ETag'])
+            unauthorized = self.retrieve(HTTP_AUTHORIZATION='ApplePass wrong')
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(unauthorized.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_save_and_delete_invalidate(self):
+        response = self.retrieve()
+        response.close()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pass_instance.save()
+        with self.assertNumQueries(1):
+            pass_ = pass_cache.get_pass(self.pass_instance.pass_type_identifier, self.pass_instance.serial_number)
+        self.assertEqual(pass_.updated_at, self.pass_instance.updated_at)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pass_instance.delete()
+        self.assertEqual(self.retrieve().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalidate_after_commit(self):
+        response = self.retrieve()
+        response.close()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.pass_instance.save()
+            # the old row is still the committed one
+            self.assertIsInstance(
+                pass_cache.get_pass(self.pass_instance.pass_type_identifier, self.pass_instance.serial_number),
+                pass_cache.CachedPass,
+            )
+        for callback in callbacks:
+            callback()
+        with self.assertNumQueries(1):
+            pass_cache.get_pass(self.pass_instance.pass_type_identifier, self.pass_instance.serial_number)